@@ -74,12 +74,14 @@ def check_and_download_ligma(force_update=False):
     """Check if ligma.py exists, download it if not, or update it if outdated"""
     ligma_path = os.path.join(os.path.dirname(__file__), "ligma.py")
     ligma_url = "https://raw.githubusercontent.com/The404Company/SigmaOS/main/ligma.py"
+    # Reuse ligma's pooled session once the module is loaded
+    http = ligma_module.get_http_session() if hasattr(ligma_module, 'get_http_session') else requests
 
     try:
         # Check if file exists
         if not os.path.exists(ligma_path):
             print(f"{INFO_STYLE}Downloading ligma.py from GitHub...{RESET_STYLE}")
-            response = requests.get(ligma_url)
+            response = http.get(ligma_url)
             if response.status_code == 200:
                 with open(ligma_path, "w", encoding="utf-8") as f:
                     f.write(response.text)
@@ -91,7 +93,7 @@ def check_and_download_ligma(force_update=False):
             # If force_update is True, skip the check and update
             if force_update:
                 print(f"{INFO_STYLE}Forcing ligma.py update...{RESET_STYLE}")
-                response = requests.get(ligma_url)
+                response = http.get(ligma_url)
                 if response.status_code == 200:
                     with open(ligma_path, "w", encoding="utf-8") as f:
                         f.write(response.text)
@@ -103,7 +105,7 @@ def check_and_download_ligma(force_update=False):
             
             # Check if file is up to date
             try:
-                response = requests.get(ligma_url)
+                response = http.get(ligma_url)
                 if response.status_code == 200:
                     current_content = ""
                     with open(ligma_path, "r", encoding="utf-8") as f:
@@ -423,6 +425,10 @@ def install_dependencies():
     
     print(f"\n{SUCCESS_STYLE}All essential packages installed successfully!{RESET_STYLE}")
 
+def get_theme_styles():
+    """Get the styles of the current theme by name, theme changes apply immediately"""
+    return {name: value for name, value in globals().items() if name.endswith('_sth')}
+
 # Load ligma module after dependencies are installed
 def load_ligma_module():
     """Import the ligma module dynamically"""
@@ -464,6 +470,20 @@ def load_ligma_module():
             if not hasattr(ligma, func):
                 print(f"{ERROR_STYLE}Error: ligma module missing required function: {func}{RESET_STYLE}")
                 return None
+
+        # Give ligma our logger and theme, so it never has to import this module
+        # (which would run the whole shell a second time as 'SigmaOS')
+        if hasattr(ligma, 'set_runtime_context'):
+            ligma.set_runtime_context(
+                log_info=log_info,
+                log_warning=log_warning,
+                log_error=log_error,
+                log_success=log_success,
+                log_debug=log_debug,
+                # loading_animation is defined further down than the first load
+                loading_animation=lambda message, duration=2, task=None: loading_animation(message, duration, task),
+                styles=get_theme_styles
+            )
                 
         return ligma
     except Exception as e:
@@ -723,7 +743,7 @@ ALL_COMMANDS = {
     'clear': [],
     'setup': [],
     'reset': [],
-    'ligma': ['list', 'install', 'uninstall', 'browse', 'search', '?v', '?version', '?i', '?info', '?h', '?help', 'src'],
+    'ligma': ['list', 'install', 'uninstall', 'browse', 'search', 'refresh', 'wheelhouse', 'blobs', 'lock', 'sync', 'mirror', 'api', '?v', '?version', '?i', '?info', '?h', '?help', 'src'],
     'alias': ['list', 'add', 'remove'],
     'sysinfo': [],
     'now': [],
@@ -860,10 +880,19 @@ def show_help():
         ("ligma list", "List installed packages"),
         ("ligma browse", "Browse all available packages"),
         ("ligma search <term>", "Search for packages"),
+        ("ligma refresh", "Rebuild the local package catalogs"),
         ("ligma install <pkg>", "Install a package"),
+        ("ligma install <pkg>@<tag>", "Install a package pinned to a tag or commit"),
         ("ligma uninstall <pkg>", "Uninstall a package"),
+        ("ligma wheelhouse build", "Pre-download package requirements"),
+        ("ligma lock", "Pin installed packages in ligma.lock"),
+        ("ligma sync", "Restore the packages pinned in ligma.lock"),
+        ("ligma mirror build|serve", "Build and serve a local package mirror"),
+        ("ligma mirror use <url>|off", "Fetch packages from a mirror or from GitHub"),
+        ("ligma api", "Show the remaining GitHub API budget"),
         ("ligma <pkg> ?v", "Show package version"),
         ("ligma <pkg> ?i", "Show package info"),
+        ("ligma <pkg> ?rollback", "Switch back to the previous version"),
         ("ligma ?help", "Show ligma help"),
         ("ligma src list", "List package sources"),
         ("ligma src verified", "Show verified sources"),
@@ -1071,13 +1100,25 @@ def setup_essential_packages():
         log_error("Failed to load ligma module for essential package installation")
         return
     
+    # Install all missing packages and their dependencies concurrently
+    missing_packages = [pkg for pkg in essential_packages if not is_valid_package(pkg)]
+    use_batch = bool(missing_packages) and hasattr(ligma_module, 'install_packages')
+    if use_batch:
+        log_info(f"Installing essential packages: {', '.join(missing_packages)}")
+        try:
+            ligma_module.install_packages(missing_packages)
+        except Exception as e:
+            print(f"{ERROR_STYLE}Error installing essential packages: {e}{RESET_STYLE}")
+            log_error("Error installing essential packages", exception=e)
+    
     for pkg in essential_packages:
         try:
-            if not is_valid_package(pkg):
+            if pkg in missing_packages and not use_batch:
                 print(f"\n{INFO_STYLE}Installing {pkg}...{RESET_STYLE}")
                 log_info(f"Installing essential package: {pkg}")
                 ligma_module.download_package(pkg)
-                
+            
+            if pkg in missing_packages:
                 # Verify installation was successful
                 if is_valid_package(pkg):
                     installed_count += 1
@@ -1170,14 +1211,24 @@ def reset_sigmaos():
     
     print(f"{INFO_STYLE}Run 'setup' to reinstall essential packages.{RESET_STYLE}")
 
+def get_package_dir(package_name):
+    """Get the directory of the active version of a package"""
+    if ligma_module is not None and hasattr(ligma_module, 'get_package_dir'):
+        return ligma_module.get_package_dir(package_name)
+    return os.path.join(PACKAGES_DIR, package_name)
+
 def is_valid_package(package_name):
     """Check if a package exists and can be executed"""
+    # ligma answers from its registry of installed packages without touching the disk
+    if ligma_module is not None and hasattr(ligma_module, 'get_package_entry_point'):
+        return ligma_module.is_valid_package(package_name)
+
     # Parse the package path with dot notation
     parts = package_name.split('.')
     base_package = parts[0]
     
     # Check if the base package directory exists
-    base_package_dir = os.path.join(PACKAGES_DIR, base_package)
+    base_package_dir = get_package_dir(base_package)
     if not os.path.exists(base_package_dir):
         return False
     
@@ -1191,11 +1242,14 @@ def is_valid_package(package_name):
     else:
         # Nested format: check if the nested file exists
         file_name = parts[-1]
-        path_components = parts[:-1]
-        return os.path.exists(os.path.join(PACKAGES_DIR, *path_components, f"{file_name}.py"))
+        path_components = parts[1:-1]
+        return os.path.exists(os.path.join(base_package_dir, *path_components, f"{file_name}.py"))
 
 def run_package(package_name):
     """Execute a package by its name"""
+    if ligma_module is not None and hasattr(ligma_module, 'get_package_entry_point'):
+        return ligma_module.run_package(package_name)
+
     # Parse the package path with dot notation
     parts = package_name.split('.')
     base_package = parts[0]
@@ -1203,18 +1257,18 @@ def run_package(package_name):
     # Handle different path formats
     if len(parts) == 1:
         # Default case: just the package name, run main.py
-        file_path = os.path.join(PACKAGES_DIR, base_package, "main.py")
+        file_path = os.path.join(get_package_dir(base_package), "main.py")
     else:
         # Nested case: handle arbitrary depth
         if len(parts) == 2:
             # Legacy format: package.file runs package/file.py
-            file_path = os.path.join(PACKAGES_DIR, parts[0], f"{parts[1]}.py")
+            file_path = os.path.join(get_package_dir(parts[0]), f"{parts[1]}.py")
         else:
             # New format: package.dir1.dir2.file runs package/dir1/dir2/file.py
             # Last part is the file name, all others are directory components
             file_name = parts[-1]
-            path_components = parts[:-1]
-            file_path = os.path.join(PACKAGES_DIR, *path_components, f"{file_name}.py")
+            path_components = parts[1:-1]
+            file_path = os.path.join(get_package_dir(base_package), *path_components, f"{file_name}.py")
 
     if not os.path.exists(file_path):
         print(f"{ERROR_STYLE}File not found: {file_path}{RESET_STYLE}")
@@ -1346,14 +1400,18 @@ def get_command_with_history():
             # Show all commands and installed packages
             completions.extend(ALL_COMMANDS.keys())
             # Add installed packages to suggestions
-            if os.path.exists(PACKAGES_DIR):
+            if ligma_module is not None and hasattr(ligma_module, 'get_package_registry'):
+                completions.extend(ligma_module.get_installed_packages())
+            elif os.path.exists(PACKAGES_DIR):
                 completions.extend([d for d in os.listdir(PACKAGES_DIR) 
                                   if os.path.isdir(os.path.join(PACKAGES_DIR, d))])
         elif len(parts) == 1:
             # Complete first word (commands or packages)
             base = parts[0]
             completions.extend([cmd for cmd in ALL_COMMANDS.keys() if cmd.startswith(base)])
-            if os.path.exists(PACKAGES_DIR):
+            if ligma_module is not None and hasattr(ligma_module, 'get_package_registry'):
+                completions.extend([pkg for pkg in ligma_module.get_installed_packages() if pkg.startswith(base)])
+            elif os.path.exists(PACKAGES_DIR):
                 completions.extend([d for d in os.listdir(PACKAGES_DIR) 
                                   if os.path.isdir(os.path.join(PACKAGES_DIR, d)) 
                                   and d.startswith(base)])
@@ -1754,9 +1812,54 @@ def handle_ligma(args):
         elif subcommand == "search" and len(args) >= 2:
             search_term = " ".join(args[1:])
             ligma_module.search_packages(search_term)
+        elif subcommand == "refresh" and hasattr(ligma_module, 'refresh_catalogs'):
+            ligma_module.refresh_catalogs()
+        elif subcommand == "wheelhouse" and len(args) == 2 and hasattr(ligma_module, 'build_wheelhouse'):
+            if args[1] == "build":
+                ligma_module.build_wheelhouse()
+            elif args[1] == "list":
+                ligma_module.show_wheelhouse()
+            elif args[1] == "clear":
+                ligma_module.clear_wheelhouse()
+            else:
+                print(f"{ERROR_STYLE}Invalid wheelhouse command. Use 'ligma wheelhouse build|list|clear'{RESET_STYLE}")
+        elif subcommand == "lock" and hasattr(ligma_module, 'write_lock_file'):
+            ligma_module.write_lock_file()
+        elif subcommand == "sync" and hasattr(ligma_module, 'sync_packages'):
+            ligma_module.sync_packages()
+        elif subcommand == "mirror" and hasattr(ligma_module, 'build_mirror'):
+            action = args[1] if len(args) > 1 else None
+            if action == "build" and len(args) <= 3:
+                ligma_module.build_mirror(args[2] if len(args) == 3 else None)
+            elif action == "serve" and len(args) <= 4:
+                mirror_dir, port = None, None
+                for arg in args[2:]:
+                    if arg.isdigit():
+                        port = int(arg)
+                    else:
+                        mirror_dir = arg
+                ligma_module.serve_mirror(mirror_dir, port)
+            elif action == "use" and len(args) == 3:
+                ligma_module.use_mirror(args[2])
+            elif action == "off" and len(args) == 2:
+                ligma_module.use_mirror(None)
+            else:
+                print(f"{ERROR_STYLE}Invalid mirror command. Use 'ligma mirror build [dir]|serve [dir] [port]|use <url>|off'{RESET_STYLE}")
+        elif subcommand == "api" and hasattr(ligma_module, 'show_api_budget'):
+            ligma_module.show_api_budget()
+        elif subcommand == "blobs" and hasattr(ligma_module, 'show_blob_store'):
+            if len(args) == 1:
+                ligma_module.show_blob_store()
+            elif len(args) == 2 and args[1] == "prune":
+                ligma_module.prune_blob_store()
+            else:
+                print(f"{ERROR_STYLE}Invalid blobs command. Use 'ligma blobs' or 'ligma blobs prune'{RESET_STYLE}")
         elif subcommand == "install":
             if len(args) == 2:
-                ligma_module.download_package(args[1])
+                if hasattr(ligma_module, 'install_package'):
+                    ligma_module.install_package(args[1])
+                else:
+                    ligma_module.download_package(args[1])
             elif len(args) >= 3 and args[-1] == "?m":
                 packages_to_install = args[1:-1]
                 ligma_module.install_multiple_packages(packages_to_install)
@@ -1787,9 +1890,15 @@ def handle_ligma(args):
                 ligma_module.show_package_info(package_name)
             elif qualifier in ["?u", "?update"]:
                 ligma_module.update_package(package_name)
+            elif qualifier == "?rollback" and hasattr(ligma_module, 'rollback_package'):
+                ligma_module.rollback_package(package_name)
+            elif qualifier == "?versions" and hasattr(ligma_module, 'show_package_versions'):
+                ligma_module.show_package_versions(package_name)
             else:
                 print(f"{ERROR_STYLE}Unknown command: ligma {args[0]} {args[1]}{RESET_STYLE}")
                 print(f"{INFO_STYLE}Try 'ligma ?help' for available commands.{RESET_STYLE}")
+        elif len(args) == 3 and args[1] == "?use" and hasattr(ligma_module, 'use_package_version'):
+            ligma_module.use_package_version(args[0], args[2])
         else:
             print(f"{ERROR_STYLE}Unknown command for ligma: {subcommand}{RESET_STYLE}")
             print(f"{INFO_STYLE}Try 'ligma ?help' for available commands.{RESET_STYLE}")
@@ -10,12 +10,25 @@ VERSION = "1.1.0"
 import os
 import sys
 import json
+import re
+import hashlib
+import bisect
 import shutil
 import platform
 import subprocess
 import time
+import random
+import tempfile
+import threading
+import uuid
 import requests
-from zipfile import ZipFile
+from requests.adapters import HTTPAdapter
+from zipfile import ZipFile, ZIP_DEFLATED
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote, unquote, urlparse
+from urllib.request import url2pathname
+from pathlib import Path
 
 # Get directory of this file
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -25,12 +38,209 @@ OFFICIAL_REPO = "The404Company/SigmaOS-packages"
 REPO_URL = f"https://github.com/{OFFICIAL_REPO}"
 PACKAGES_DIR = os.path.join(CURRENT_DIR, "packages")
 SOURCES_FILE = os.path.join(CURRENT_DIR, "ligma.sigs")
+CACHE_DIR = os.path.join(CURRENT_DIR, ".ligma")
+CATALOG_DIR = os.path.join(CACHE_DIR, "catalog")
+
+# Packages are built in STAGING_DIR and renamed into PACKAGES_DIR once complete;
+# replaced and uninstalled trees are moved to TRASH_DIR and deleted in the background
+STAGING_DIR = os.path.join(CACHE_DIR, "staging")
+TRASH_DIR = os.path.join(CACHE_DIR, "trash")
+
+# Requirements already resolved for a package version, so reinstalls skip pip
+REQUIREMENTS_CACHE_FILE = os.path.join(CACHE_DIR, "requirements.json")
+
+# Local wheels of package requirements, preferred over PyPI when installing
+WHEELHOUSE_DIR = os.path.join(CACHE_DIR, "wheelhouse")
+
+# Previous versions of each package are kept under VERSIONS_DIR/<package>/<version>;
+# the CURRENT_VERSION_FILE next to them names the version in PACKAGES_DIR
+VERSIONS_DIR = os.path.join(CACHE_DIR, "versions")
+CURRENT_VERSION_FILE = "current"
+
+# Number of previous versions kept per package for rollbacks
+VERSIONS_KEPT = 3
+
+# Content-addressed store of every downloaded file, keyed by git blob SHA;
+# package trees are hardlinked from it so identical files are stored once
+BLOBS_DIR = os.path.join(CACHE_DIR, "blobs")
+
+# Each blob has a record of its size, mtime and inode next to it. Package files
+# share the inode of their blob, so a blob whose stat no longer matches its
+# record was rewritten in place and is verified before it is linked again
+BLOB_RECORD_SUFFIX = ".stat"
+
+# Tags and abbreviated SHAs resolved to full commit SHAs; tags are treated as
+# immutable, so once resolved they are never looked up again
+REFS_CACHE_FILE = os.path.join(CACHE_DIR, "refs.json")
+_refs_lock = threading.Lock()
+
+# Seconds a ref found not to be a tag is remembered as a branch, so installs
+# from a branch don't look up the tag on every call
+BRANCH_REF_TTL = 3600
+
+# Which source served each package, which sources lacked it and how fast each
+# source answers, so repeat lookups go straight to the right source
+SOURCE_CACHE_FILE = os.path.join(CACHE_DIR, "sources.json")
+_source_cache = None
+_source_cache_lock = threading.Lock()
+
+# Installed packages and their entry points, built by get_package_registry.
+# Dropped on every install event; changes made by other processes are noticed
+# through the mtime of PACKAGES_DIR, checked at most every REGISTRY_CHECK_INTERVAL seconds.
+# Scripts added inside a package don't change that mtime, so a command that
+# isn't found rescans its package; the same command again only after REGISTRY_CHECK_INTERVAL.
+REGISTRY_CHECK_INTERVAL = 2
+_package_registry = None
+_package_registry_lock = threading.RLock()
+
+# Snapshots of the configured sources made by 'ligma mirror build' and served
+# to other machines by 'ligma mirror serve'
+MIRROR_DIR = os.path.join(CACHE_DIR, "mirror")
+MIRROR_PORT = 8765
+# Owner and repository names the mirror server accepts; anything else, such as
+# '..' or an encoded path separator, could address files outside the mirror
+MIRROR_NAME_PATTERN = re.compile(r"[A-Za-z0-9_.-]+")
+
+# SigmaOS user settings; 'ligma_mirror' in it redirects all GitHub traffic to a mirror
+USER_SETTINGS_FILE = os.path.join(CURRENT_DIR, "user.sigs")
+_user_settings_cache = {'mtime': None, 'settings': {}}
+
+# Exact source commit and file blob SHAs of every installed package, written by
+# 'ligma lock' and restored by 'ligma sync'
+LOCK_FILE = os.path.join(CURRENT_DIR, "ligma.lock")
+
+# Libraries that ship with SigmaOS and are never installed for packages
+CORE_LIBS = {"colorama", "requests", "datetime", "json"}
+
+# File inside each installed package recording where it came from and the
+# git blob SHA of every file that was installed
+MANIFEST_FILE = ".ligma.json"
+
+# Branch packages are installed from
+DEFAULT_REF = "main"
+
+# Number of files fetched at the same time when installing a package
+DOWNLOAD_WORKERS = 8
+
+# How often a failed file download is retried, and the base delay (in seconds)
+# of the exponential backoff between attempts
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 0.5
+
+# Downloads are streamed to disk in chunks of this many bytes
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Server responses worth retrying; anything else (like a 404) fails at once
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# Multi-package installs and updates download a source's repository archive
+# only when at least this many of the requested files are missing from the
+# blob store. Fewer files are fetched one by one by the parallel scheduler,
+# which with DOWNLOAD_WORKERS downloads in flight beats one whole-repository zip.
+ARCHIVE_MIN_FILES = 32
+
+# How long (in seconds) a source catalog is used for browsing and searching
+# before it is revalidated against the source
+CATALOG_TTL = 3600
+
+# How long (in seconds) a repository tree is reused for installs and update
+# checks before it is revalidated
+TREE_CACHE_TTL = 60
+
+# Query all sources at once when looking up a package instead of one after another
+SOURCE_RACING = True
+
+# Time (in seconds) a source gets to answer during a race before it is skipped
+SOURCE_DEADLINE = 10
+
+# How long (in seconds) the source that served a package is asked first, and
+# how long a source that didn't have a package is only asked as a last resort
+SOURCE_HIT_TTL = 6 * 3600
+SOURCE_MISS_TTL = 600
+
+# Weight of the newest sample in the rolling latency score of a source
+LATENCY_SMOOTHING = 0.3
+
+# Order sources other than the official one by their latency score. Off by
+# default: with several sources offering a package of the same name, this
+# would let the fastest one win instead of the one configured first
+ORDER_SOURCES_BY_LATENCY = False
+
+# Default (connect, read) timeout in seconds for network requests
+HTTP_TIMEOUT = (5, 30)
+
+# Number of keep-alive connections pooled per host
+HTTP_POOL_SIZE = DOWNLOAD_WORKERS * 2
+
+# Number of packages installed at the same time by multi-package installs
+MAX_PARALLEL_INSTALLS = 4
+
+# Maximum number of file downloads in flight across all concurrent installs
+MAX_CONNECTIONS = HTTP_POOL_SIZE
+_connection_budget = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+# pip must never run twice at once, and the requirements cache is shared
+_pip_lock = threading.RLock()
+
+# Per-thread state of scheduled installs (package name and progress display)
+_install_context = threading.local()
+
+# GitHub API token, read from this environment variable or the 'github_token'
+# user setting. Raises the API budget from 60 to 5000 requests per hour.
+GITHUB_TOKEN_ENV = "GITHUB_TOKEN"
+
+# How often a rate-limited GitHub API request is retried, and the base delay
+# (in seconds) of the exponential backoff between attempts
+API_MAX_RETRIES = 4
+API_BACKOFF = 1.0
+
+# Longest wait (in seconds) for the API budget to reset before giving up
+API_MAX_WAIT = 60
+
+# Below this many remaining API requests, calls are spread out until the reset
+API_LOW_BUDGET = 10
+
+# GitHub API budget as last reported by the X-RateLimit headers
+_api_budget = {'limit': None, 'remaining': None, 'reset': None, 'warned': False}
+_api_budget_lock = threading.Lock()
+
+# Shared HTTP session, created on first use by get_http_session
+_http_session = None
+_http_session_lock = threading.Lock()
+
+# Relevance of a search term depending on where it appears in a package
+SEARCH_WEIGHTS = {'name': 8, 'author': 3, 'description': 1}
+
+# Sorted search vocabularies of loaded catalogs, keyed by (source, ref)
+_vocabulary_cache = {}
+
+# Serialises background deletion of trashed package trees
+_reaper_lock = threading.Lock()
+
+# Source catalogs loaded during this session, keyed by (source, ref)
+_catalog_cache = {}
+_catalog_locks = {}
+_catalog_locks_lock = threading.Lock()
 
 # Verified external sources list - curated list of trusted package repositories
 VERIFIED_SOURCES = [
     # Add verified sources here
 ]
 
+# Requirement parsing uses packaging, which pip vendors if it isn't installed on its own
+try:
+    from packaging.requirements import Requirement
+except ImportError:
+    try:
+        from pip._vendor.packaging.requirements import Requirement
+    except ImportError:
+        Requirement = None
+
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError:
+    importlib_metadata = None
+
 # Try to import colorama for styling
 try:
     from colorama import Fore, Style
@@ -48,48 +258,95 @@ except ImportError:
     INFO_STYLE = ""
     RESET_STYLE = ""
 
+# Theme styles used when ligma runs without SigmaOS
+FALLBACK_STYLES = {
+    'package_sth': SUCCESS_STYLE,
+    'description_sth': RESET_STYLE,
+    'package_status_sth': INFO_STYLE,
+    'command_sth': SUCCESS_STYLE,
+    'header_sth': INFO_STYLE
+}
+
+# Logger, theme and loading animation of the shell ligma runs in, installed
+# by set_runtime_context. Empty entries fall back to plain console output.
+_runtime_context = {
+    'log_info': None,
+    'log_warning': None,
+    'log_error': None,
+    'log_success': None,
+    'log_debug': None,
+    'loading_animation': None,
+    'styles': None
+}
+
+def set_runtime_context(log_info=None, log_warning=None, log_error=None, log_success=None,
+                        log_debug=None, loading_animation=None, styles=None, http_session=None):
+    """Connect ligma to the shell that loaded it
+    
+    SigmaOS calls this once after loading ligma, so ligma never has to import
+    SigmaOS itself (which would run the whole shell module a second time).
+    Anything not given keeps the standalone behaviour.
+    
+    Args:
+        log_info, log_warning, log_error, log_success, log_debug (callable, optional): Log functions
+        loading_animation (callable, optional): Called as loading_animation(message, duration, task)
+        styles (callable, optional): Returns the current theme styles by name, e.g. {'package_sth': ...}
+        http_session (requests.Session, optional): Session to use instead of ligma's own
+    """
+    global _http_session
+    _runtime_context.update(
+        log_info=log_info, log_warning=log_warning, log_error=log_error, log_success=log_success,
+        log_debug=log_debug, loading_animation=loading_animation, styles=styles
+    )
+    if http_session is not None:
+        with _http_session_lock:
+            _http_session = http_session
+
+def get_styles(*names):
+    """Get theme styles of the shell by name, or their fallbacks when running standalone"""
+    styles = _runtime_context['styles']() if _runtime_context['styles'] else {}
+    return [styles.get(name, FALLBACK_STYLES.get(name, "")) for name in names]
+
+def get_style(name):
+    """Get a single theme style, see get_styles"""
+    return get_styles(name)[0]
+
 # Log function (simplified version)
 def log_info(message):
     """Simple logging function"""
-    # Get the logging function from SigmaOS if available
-    try:
-        from SigmaOS import log_info as sigma_log_info
-        sigma_log_info(message)
-    except ImportError:
+    if _runtime_context['log_info']:
+        _runtime_context['log_info'](message)
+    else:
         print(f"[INFO] {message}")
 
 def log_error(message, exception=None):
     """Simple error logging function"""
-    try:
-        from SigmaOS import log_error as sigma_log_error
-        sigma_log_error(message, exception=exception)
-    except ImportError:
+    if _runtime_context['log_error']:
+        _runtime_context['log_error'](message, exception=exception)
+    else:
         print(f"[ERROR] {message}")
         if exception:
             print(f"Exception: {exception}")
 
 def log_warning(message):
     """Simple warning logging function"""
-    try:
-        from SigmaOS import log_warning as sigma_log_warning
-        sigma_log_warning(message)
-    except ImportError:
+    if _runtime_context['log_warning']:
+        _runtime_context['log_warning'](message)
+    else:
         print(f"[WARNING] {message}")
 
 def log_success(message):
     """Simple success logging function"""
-    try:
-        from SigmaOS import log_success as sigma_log_success
-        sigma_log_success(message)
-    except ImportError:
+    if _runtime_context['log_success']:
+        _runtime_context['log_success'](message)
+    else:
         print(f"[SUCCESS] {message}")
 
 def log_debug(message):
     """Simple debug logging function"""
-    try:
-        from SigmaOS import log_debug as sigma_log_debug
-        sigma_log_debug(message)
-    except ImportError:
+    if _runtime_context['log_debug']:
+        _runtime_context['log_debug'](message)
+    else:
         print(f"[DEBUG] {message}")
 
 def loading_animation(message, duration=2, task=None):
@@ -97,56 +354,241 @@ def loading_animation(message, duration=2, task=None):
     Show a loading animation for a fixed duration or while a task runs.
     If task is provided, it should be a function (optionally with args/kwargs).
     """
-    # Try to use SigmaOS loading_animation if available
+    # Scheduled installs show their state in the aggregated progress line
+    if task and getattr(_install_context, 'progress', None) is not None:
+        report_install_progress(message)
+        return task()
+
+    # Use the animation of the shell if there is one
+    if _runtime_context['loading_animation']:
+        return _runtime_context['loading_animation'](message, duration, task)
+
+    # Fallback simple loading animation
+    if task:
+        print(f"{INFO_STYLE}{message}...{RESET_STYLE}")
+        result = task()
+        print(f"{SUCCESS_STYLE}✓ {message}{RESET_STYLE}")
+        return result
+    else:
+        print(f"{INFO_STYLE}{message}...{RESET_STYLE}")
+        time.sleep(duration)
+        print(f"{SUCCESS_STYLE}✓ {message}{RESET_STYLE}")
+
+class _PooledSession(requests.Session):
+    """requests.Session that applies HTTP_TIMEOUT to every request without an explicit timeout"""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+def get_http_session():
+    """Get the process-wide HTTP session used for all ligma network I/O
+    
+    The session keeps connections alive and pools them per host, so repeated
+    requests to GitHub skip the TCP and TLS handshakes.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = _PooledSession()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    'Accept-Encoding': 'gzip, deflate',
+                    'User-Agent': f'ligma/{VERSION}'
+                })
+                _http_session = session
+    return _http_session
+
+def load_source_cache():
+    """Get the source resolution cache, loading it from disk on first use
+    
+    Must be called with _source_cache_lock held.
+    """
+    global _source_cache
+    if _source_cache is None:
+        try:
+            with open(SOURCE_CACHE_FILE, 'r', encoding='utf-8') as f:
+                _source_cache = json.load(f)
+        except (OSError, ValueError):
+            _source_cache = {}
+        for key in ('hits', 'misses', 'latency'):
+            _source_cache.setdefault(key, {})
+    return _source_cache
+
+def save_source_cache():
+    """Save the source resolution cache atomically, must be called with _source_cache_lock held"""
     try:
-        from SigmaOS import loading_animation as sigma_loading_animation
-        return sigma_loading_animation(message, duration, task)
-    except ImportError:
-        # Fallback simple loading animation
-        if task:
-            print(f"{INFO_STYLE}{message}...{RESET_STYLE}")
-            result = task()
-            print(f"{SUCCESS_STYLE}✓ {message}{RESET_STYLE}")
-            return result
-        else:
-            print(f"{INFO_STYLE}{message}...{RESET_STYLE}")
-            time.sleep(duration)
-            print(f"{SUCCESS_STYLE}✓ {message}{RESET_STYLE}")
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(f"{SOURCE_CACHE_FILE}.part", 'w', encoding='utf-8') as f:
+            json.dump(load_source_cache(), f, indent=2)
+        os.replace(f"{SOURCE_CACHE_FILE}.part", SOURCE_CACHE_FILE)
+    except Exception as e:
+        log_error("Error saving source cache", exception=e)
+
+def record_package_source(package_name, source, ref=DEFAULT_REF):
+    """Remember the source that served a package"""
+    key = f"{package_name}@{ref}"
+    with _source_cache_lock:
+        cache = load_source_cache()
+        cache['hits'][key] = {'source': source, 'at': time.time()}
+        misses = cache['misses'].get(key)
+        if misses:
+            misses.pop(source, None)
+        save_source_cache()
+
+def record_package_miss(package_name, source, ref=DEFAULT_REF):
+    """Remember that a source doesn't have a package"""
+    key = f"{package_name}@{ref}"
+    with _source_cache_lock:
+        cache = load_source_cache()
+        cache['misses'].setdefault(key, {})[source] = time.time()
+        if cache['hits'].get(key, {}).get('source') == source:
+            del cache['hits'][key]
+        save_source_cache()
+
+def record_source_latency(source, seconds):
+    """Fold a response time into the rolling latency score of a source
+    
+    The score is kept in memory and written out with the next hit or miss.
+    """
+    with _source_cache_lock:
+        latency = load_source_cache()['latency']
+        previous = latency.get(source)
+        latency[source] = seconds if previous is None else previous + LATENCY_SMOOTHING * (seconds - previous)
+
+def get_source_latencies():
+    """Get the rolling latency score in seconds of every measured source"""
+    with _source_cache_lock:
+        return dict(load_source_cache()['latency'])
+
+def plan_source_lookup(package_name, sources, ref=DEFAULT_REF):
+    """Split sources into the groups a package lookup should try one after another
+    
+    The source that recently served the package comes first on its own, then
+    the sources not known to lack it, then those that recently didn't have it.
+    Empty groups are left out and each group keeps the order of sources.
+    
+    Returns:
+        list: Lists of sources
+    """
+    key = f"{package_name}@{ref}"
+    now = time.time()
+    with _source_cache_lock:
+        cache = load_source_cache()
+        hit = cache['hits'].get(key)
+        misses = cache['misses'].get(key, {})
+    hinted = hit['source'] if hit and now - hit['at'] < SOURCE_HIT_TTL and hit['source'] in sources else None
+    unlikely = [source for source in sources if now - misses.get(source, 0) < SOURCE_MISS_TTL and source != hinted]
+    likely = [source for source in sources if source not in unlikely and source != hinted]
+    return [group for group in ([hinted] if hinted else [], likely, unlikely) if group]
+
+def race_sources(sources, probe, deadline=None):
+    """Query several sources concurrently and pick the winner by priority
+    
+    All sources are probed at the same time. The result of a source is only
+    used once every source before it in the list has failed or missed its
+    deadline, so the priority order is kept while the total wait is bounded by
+    the slowest source that actually matters. Probes of losing sources are
+    cancelled.
+    
+    Args:
+        sources (list): Sources in priority order
+        probe (callable): Called as probe(source, cancel_event), returns a result or None
+        deadline (float, optional): Seconds each source gets to answer. Defaults to SOURCE_DEADLINE.
+    
+    Returns:
+        tuple: (source, result) of the winning source or (None, None)
+    """
+    if not sources:
+        return None, None
+
+    deadline = SOURCE_DEADLINE if deadline is None else deadline
+    cancel_event = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(sources))
+    start_time = time.time()
+    try:
+        futures = [executor.submit(probe, source, cancel_event) for source in sources]
+        for source, future in zip(sources, futures):
+            remaining = max(0, start_time + deadline - time.time())
+            try:
+                result = future.result(timeout=remaining)
+            except Exception as e:
+                log_debug(f"Source {source} did not answer in time or failed: {e}")
+                continue
+            if result is not None:
+                return source, result
+        return None, None
+    finally:
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
 
-def get_github_file_content(package_name, filename, source=None):
+def _fetch_raw_text(source, path, cancel_event=None, timeout=None, ref=DEFAULT_REF):
+    """Fetch a raw text file from a source, returns None if it doesn't exist
+    
+    Raises:
+        requests.RequestException: If the source failed for another reason
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        return None
+    if is_local_source(source):
+        content = read_local_source_file(source, path)
+        return content.strip() if content is not None else None
+    kwargs = {'timeout': timeout} if timeout else {}
+    with get_http_session().get(get_raw_file_url(source, path, resolve_ref(source, ref)), stream=True, **kwargs) as response:
+        record_source_latency(source, response.elapsed.total_seconds())
+        if response.status_code != 404:
+            response.raise_for_status()
+        if response.status_code != 200 or (cancel_event is not None and cancel_event.is_set()):
+            return None
+        return response.text.strip()
+
+def get_github_file_content(package_name, filename, source=None, ref=DEFAULT_REF):
     """Fetch raw file content from GitHub
     
     Args:
         package_name (str): Name of the package
         filename (str): Name of the file to fetch
         source (str, optional): Specific source to check. If None, checks all sources.
+        ref (str): Branch, tag or commit to read from
     """
+    path = f"{package_name}/{filename}"
     if source:
         # Check specific source
-        url = f"https://raw.githubusercontent.com/{source}/main/{package_name}/{filename}"
         try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.text.strip()
+            return _fetch_raw_text(source, path, ref=ref)
         except:
-            pass
-        return None
+            return None
         
-    # Check all configured sources
-    sources = load_sources()
-    # Try official repo first
-    if OFFICIAL_REPO in sources:
-        sources.remove(OFFICIAL_REPO)
-        sources.insert(0, OFFICIAL_REPO)
-    
-    for src in sources:
-        url = f"https://raw.githubusercontent.com/{src}/main/{package_name}/{filename}"
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.text.strip()
-        except:
+    def probe(src, cancel_event=None, timeout=None):
+        content = _fetch_raw_text(src, path, cancel_event, timeout=timeout, ref=ref)
+        # A probe cut short by the race being decided says nothing about the source
+        if content is None and not (cancel_event is not None and cancel_event.is_set()):
+            record_package_miss(package_name, src, ref)
+        return content
+
+    # Check all configured sources, starting with the one that served the package before
+    for sources in plan_source_lookup(package_name, get_ordered_sources(), ref):
+        if SOURCE_RACING and len(sources) > 1:
+            src, content = race_sources(
+                sources,
+                lambda src, cancel_event: probe(src, cancel_event, timeout=SOURCE_DEADLINE)
+            )
+            if content is not None:
+                record_package_source(package_name, src, ref)
+                return content
             continue
+
+        for src in sources:
+            try:
+                content = probe(src)
+                if content is not None:
+                    record_package_source(package_name, src, ref)
+                    return content
+            except:
+                continue
     return None
 
 def parse_description_file(content):
@@ -155,7 +597,8 @@ def parse_description_file(content):
         'description': 'No description available',
         'author': 'Unknown',
         'version': '0.0',
-        'requirements': []
+        'requirements': [],
+        'dependencies': []
     }
     
     current_section = None
@@ -169,7 +612,7 @@ def parse_description_file(content):
             continue
             
         if current_section:
-            if current_section == 'requirements':
+            if current_section in ('requirements', 'dependencies'):
                 if line:
                     sections[current_section].append(line)
             else:
@@ -194,17 +637,18 @@ def get_package_description(package_name, source=None, installed=True):
         except:
             pass
     
-    # Try to fetch from GitHub for non-installed packages
-    content = get_github_file_content(package_name, "description.txt", source=source)
-    if content:
-        return parse_description_file(content)
+    # Look up non-installed packages in the source catalogs
+    _, entry = find_catalog_package(package_name, source=source)
+    if entry and 'description' in entry:
+        return entry
     
-    return {'description': 'No description available', 'author': 'Unknown', 'version': '0.0', 'requirements': []}
+    return {'description': 'No description available', 'author': 'Unknown', 'version': '0.0', 'requirements': [], 'dependencies': []}
 
 def get_package_version(package_name):
     """Show the version of a package"""
-    desc = get_package_description(package_name, is_valid_package(package_name))
-    installed_text = "installed" if is_valid_package(package_name) else "available"
+    installed = is_valid_package(package_name)
+    desc = get_package_description(package_name, installed=installed)
+    installed_text = "installed" if installed else "available"
     print(f"\n{INFO_STYLE}Package {package_name} ({installed_text}){RESET_STYLE}")
     print(f"{SUCCESS_STYLE}Version: {desc['version']}{RESET_STYLE}")
 
@@ -252,21 +696,9 @@ def show_package_info(package_name):
 
 def show_installed_packages():
     """Show only installed packages"""
-    installed_packages = []
-    if os.path.exists(PACKAGES_DIR):
-        installed_packages = [d for d in os.listdir(PACKAGES_DIR) 
-                            if os.path.isdir(os.path.join(PACKAGES_DIR, d)) 
-                            and not d.startswith('.') 
-                            and d != "SigmaOS-packages-main"]
+    installed_packages = get_installed_packages()
     
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import package_sth, description_sth, package_status_sth, SUCCESS_STYLE, WARNING_STYLE, ERROR_STYLE
-    except ImportError:
-        # Fallback styles
-        package_sth = SUCCESS_STYLE
-        description_sth = RESET_STYLE
-        package_status_sth = INFO_STYLE
+    package_sth, description_sth, package_status_sth = get_styles('package_sth', 'description_sth', 'package_status_sth')
     
     if installed_packages:
         print(f"\n{SUCCESS_STYLE}Installed Packages:{RESET_STYLE}")
@@ -280,64 +712,50 @@ def show_installed_packages():
         print(f"{WARNING_STYLE}No packages installed. Use 'ligma browse' to see available packages.{RESET_STYLE}")
 
 def search_packages(search_term):
-    """Search for packages by name or description"""
+    """Search for packages by name, description or author
+    
+    Several terms can be given; packages have to match all of them, either as
+    a whole word or as a word prefix. Results are ranked by relevance.
+    """
     search_term = search_term.lower()
     
     # Get installed packages first (for status tracking)
-    installed_packages = []
-    if os.path.exists(PACKAGES_DIR):
-        installed_packages = [d for d in os.listdir(PACKAGES_DIR) 
-                            if os.path.isdir(os.path.join(PACKAGES_DIR, d)) 
-                            and not d.startswith('.')]
+    installed_packages = get_installed_packages()
     
-    # Search all configured sources
-    sources = load_sources()
-    if OFFICIAL_REPO in sources:
-        sources.remove(OFFICIAL_REPO)
-        sources.insert(0, OFFICIAL_REPO)  # Search official repo first
-        
+    # Search the indexes of all configured sources
+    sources = get_ordered_sources()
     found_packages = {}  # Use dict to avoid duplicates, store source info
+    scores = {}
+    catalogs = {}
     
     for source in sources:
         print(f"{INFO_STYLE}Searching in {source}...{RESET_STYLE}")
-        headers = {'Accept': 'application/vnd.github.v3+json'}
-        response = requests.get(f"https://api.github.com/repos/{source}/contents/", headers=headers)
-        
-        if response.status_code == 200:
-            data = response.json()
-            package_names = [item["name"] for item in data 
-                           if item["type"] == "dir" and not item["name"].startswith('.')]
-            
-            # First check name matches
-            for pkg in package_names:
-                if search_term in pkg.lower() and pkg not in found_packages:
-                    found_packages[pkg] = source
-            
-            # Then check descriptions
-            for pkg in package_names:
-                if pkg not in found_packages:  # Skip if already found by name
-                    desc = get_package_description(pkg, source=source, installed=(pkg in installed_packages))
-                    if search_term in desc['description'].lower():
-                        found_packages[pkg] = source
+        catalog = get_catalog(source)
+        if not catalog:
+            continue
+        catalogs[source] = catalog
+        for pkg, score in search_catalog(catalog, search_term).items():
+            # Sources earlier in the list take precedence for duplicate names
+            if pkg not in found_packages:
+                found_packages[pkg] = source
+                scores[pkg] = score
     
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import package_sth, description_sth, package_status_sth, SUCCESS_STYLE, WARNING_STYLE, ERROR_STYLE
-    except ImportError:
-        # Fallback styles
-        package_sth = SUCCESS_STYLE
-        description_sth = RESET_STYLE
-        package_status_sth = INFO_STYLE
+    ranked_packages = sorted(found_packages, key=lambda pkg: (-scores[pkg], pkg.lower()))
+    
+    package_sth, description_sth, package_status_sth = get_styles('package_sth', 'description_sth', 'package_status_sth')
     
     if found_packages:
         print(f"\n{SUCCESS_STYLE}Found {len(found_packages)} package(s) matching '{search_term}':{RESET_STYLE}")
         
-        for pkg, source in found_packages.items():
+        for pkg in ranked_packages:
+            source = found_packages[pkg]
             is_installed = pkg in installed_packages
             status = f"{SUCCESS_STYLE}[Installed]{RESET_STYLE}" if is_installed else f"{WARNING_STYLE}[Available]{RESET_STYLE}"
             source_text = f"{INFO_STYLE}[{source}]{RESET_STYLE}"
             
-            desc = get_package_description(pkg, source=source, installed=is_installed)
+            desc = catalogs[source]['packages'][pkg]
+            if 'description' not in desc:
+                desc = get_package_description(pkg, source=source, installed=is_installed)
             print(f"\n{package_sth}{pkg} {status} {source_text}")
             print(f"{description_sth}{desc['description']}")
             print(f"{package_status_sth}Author: {desc['author']} - Version: {desc['version']}")
@@ -350,37 +768,19 @@ def browse_source(source):
     Args:
         source (str): The source repository in format username/repo
     """
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import (
-            package_sth, description_sth, package_status_sth, command_sth,
-            header_sth, SUCCESS_STYLE, WARNING_STYLE, ERROR_STYLE, INFO_STYLE
-        )
-    except ImportError:
-        # Fallback styles
-        package_sth = SUCCESS_STYLE
-        description_sth = RESET_STYLE
-        package_status_sth = INFO_STYLE
-        command_sth = SUCCESS_STYLE
-        header_sth = INFO_STYLE
+    package_sth, description_sth, package_status_sth, command_sth, header_sth = get_styles(
+        'package_sth', 'description_sth', 'package_status_sth', 'command_sth', 'header_sth'
+    )
     
     try:
         # Get installed packages first for status tracking
-        installed_packages = []
-        if os.path.exists(PACKAGES_DIR):
-            installed_packages = [d for d in os.listdir(PACKAGES_DIR) 
-                               if os.path.isdir(os.path.join(PACKAGES_DIR, d)) 
-                               and not d.startswith('.')]
+        installed_packages = get_installed_packages()
 
-        # Get packages from the specified source
-        headers = {'Accept': 'application/vnd.github.v3+json'}
-        response = requests.get(f"https://api.github.com/repos/{source}/contents/", headers=headers)
-        loading_animation(f"Fetching packages from {source}...")
+        # Get packages from the catalog of the specified source
+        catalog = loading_animation(f"Fetching packages from {source}...", task=lambda: get_catalog(source))
 
-        if response.status_code == 200:
-            data = response.json()
-            available_packages = [item["name"] for item in data 
-                               if item["type"] == "dir" and not item["name"].startswith('.')]
+        if catalog:
+            available_packages = list(catalog['packages'])
 
             if not available_packages:
                 print(f"{WARNING_STYLE}No packages found in {source}.{RESET_STYLE}")
@@ -390,39 +790,22 @@ def browse_source(source):
             for i, pkg in enumerate(available_packages):
                 if i > 0:  # Add empty line before each package except the first one
                     print()
-                try:
-                    # Try to get package description from this source
-                    desc_url = f"https://raw.githubusercontent.com/{source}/main/{pkg}/description.txt"
-                    desc_response = requests.get(desc_url)
-                    if desc_response.status_code == 200:
-                        desc = parse_description_file(desc_response.text)
-                        status = f"{SUCCESS_STYLE}[Installed]{RESET_STYLE}" if pkg in installed_packages else f"{WARNING_STYLE}[Available]{RESET_STYLE}"
-                        print(f"{package_sth}{pkg} {status} {description_sth}- {desc['description']}")
-                        print(f"{package_status_sth}{desc['author']} {description_sth}- v{desc['version']}")
-                    else:
-                        print(f"{package_sth}{pkg} {WARNING_STYLE}[No description available]{RESET_STYLE}")
-                except Exception as e:
-                    print(f"{package_sth}{pkg} {ERROR_STYLE}[Error: {str(e)}]{RESET_STYLE}")
+                desc = catalog['packages'][pkg]
+                if 'description' in desc:
+                    status = f"{SUCCESS_STYLE}[Installed]{RESET_STYLE}" if pkg in installed_packages else f"{WARNING_STYLE}[Available]{RESET_STYLE}"
+                    print(f"{package_sth}{pkg} {status} {description_sth}- {desc['description']}")
+                    print(f"{package_status_sth}{desc['author']} {description_sth}- v{desc['version']}")
+                else:
+                    print(f"{package_sth}{pkg} {WARNING_STYLE}[No description available]{RESET_STYLE}")
         else:
-            print(f"{ERROR_STYLE}Error fetching from {source}. Status code: {response.status_code}{RESET_STYLE}")
-            if response.status_code == 404:
-                print(f"{INFO_STYLE}Repository may not exist or may be private.{RESET_STYLE}")
+            print(f"{ERROR_STYLE}Error fetching from {source}.{RESET_STYLE}")
+            print(f"{INFO_STYLE}Repository may not exist, may be private or can't be reached.{RESET_STYLE}")
     except Exception as e:
         print(f"{ERROR_STYLE}Error browsing source {source}: {e}{RESET_STYLE}")
 
 def browse_packages():
     """Browse available packages"""
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import (
-            command_sth, description_sth, header_sth,
-            SUCCESS_STYLE, WARNING_STYLE, ERROR_STYLE, INFO_STYLE
-        )
-    except ImportError:
-        # Fallback styles
-        command_sth = SUCCESS_STYLE
-        description_sth = RESET_STYLE
-        header_sth = INFO_STYLE
+    command_sth, description_sth, header_sth = get_styles('command_sth', 'description_sth', 'header_sth')
     
     sources = load_sources()
     
@@ -441,29 +824,14 @@ def browse_packages():
 
 def show_ligma_version():
     """Display the ligma package manager version"""
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import description_sth
-    except ImportError:
-        # Fallback style
-        description_sth = RESET_STYLE
+    description_sth = get_style('description_sth')
         
     print(f"\n{INFO_STYLE}Ligma Package Manager v{VERSION}{RESET_STYLE}")
     print(f"{description_sth}The lightweight package manager for SigmaOS{RESET_STYLE}")
 
 def show_ligma_help():
     """Show detailed help for all ligma commands"""
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import command_sth, description_sth, header_sth, INFO_STYLE, SUCCESS_STYLE, RESET_STYLE
-    except ImportError:
-        # Fallback styles
-        command_sth = SUCCESS_STYLE
-        description_sth = RESET_STYLE
-        header_sth = INFO_STYLE
-        INFO_STYLE = INFO_STYLE
-        SUCCESS_STYLE = SUCCESS_STYLE
-        RESET_STYLE = RESET_STYLE
+    command_sth, description_sth, header_sth = get_styles('command_sth', 'description_sth', 'header_sth')
     
     print(f"\n{header_sth}╔══ Ligma Package Manager Help ══════════════════════════╗{RESET_STYLE}")
     
@@ -472,7 +840,8 @@ def show_ligma_help():
     browse_commands = [
         ("ligma list", "Show installed packages only"),
         ("ligma browse", "Browse all available packages"),
-        ("ligma search <term>", "Search for packages by name or description")
+        ("ligma search <term>", "Search for packages by name or description"),
+        ("ligma refresh", "Rebuild the local package catalogs")
     ]
     for cmd, desc in browse_commands:
         print(f"{command_sth}  {cmd:<30}{description_sth} - {desc}")
@@ -481,8 +850,14 @@ def show_ligma_help():
     print(f"\n{INFO_STYLE}Package Management:{RESET_STYLE}")
     manage_commands = [
         ("ligma install <pkg>", "Install a package"),
+        ("ligma install <pkg>@<tag|sha>", "Install a package pinned to a tag or commit"),
         ("ligma install <pkg1> <pkg2> ?m", "Install multiple packages"),
-        ("ligma uninstall <pkg>", "Uninstall a package")
+        ("ligma uninstall <pkg>", "Uninstall a package"),
+        ("ligma wheelhouse build", "Pre-download wheels for offline installs"),
+        ("ligma wheelhouse list", "List wheels in the wheelhouse"),
+        ("ligma wheelhouse clear", "Delete the wheelhouse"),
+        ("ligma blobs", "Show the size of the blob store"),
+        ("ligma blobs prune", "Delete blobs no package uses")
     ]
     for cmd, desc in manage_commands:
         print(f"{command_sth}  {cmd:<30}{description_sth} - {desc}")
@@ -493,7 +868,8 @@ def show_ligma_help():
         ("ligma <pkg> ?v", "Show package version"),
         ("ligma <pkg> ?version", "Show package version"),
         ("ligma <pkg> ?i", "Show full package information"),
-        ("ligma <pkg> ?info", "Show full package information")
+        ("ligma <pkg> ?info", "Show full package information"),
+        ("ligma <pkg> ?versions", "List kept versions of a package")
     ]
     for cmd, desc in info_commands:
         print(f"{command_sth}  {cmd:<30}{description_sth} - {desc}")
@@ -504,7 +880,16 @@ def show_ligma_help():
         ("ligma ?u", "Check all packages for updates"),
         ("ligma ?update", "Check all packages for updates"),
         ("ligma <pkg> ?u", "Update specific package"),
-        ("ligma <pkg> ?update", "Update specific package")
+        ("ligma <pkg> ?update", "Update specific package"),
+        ("ligma <pkg> ?rollback", "Switch back to the previous version"),
+        ("ligma <pkg> ?use <version>", "Switch to a kept version"),
+        ("ligma lock", "Pin installed packages in ligma.lock"),
+        ("ligma sync", "Restore the packages pinned in ligma.lock"),
+        ("ligma mirror build [dir]", "Snapshot all sources into a mirror"),
+        ("ligma mirror serve [dir] [port]", "Serve the mirror to other machines"),
+        ("ligma mirror use <url>", "Fetch packages from a mirror"),
+        ("ligma mirror off", "Fetch packages from GitHub again"),
+        ("ligma api", "Show the remaining GitHub API budget")
     ]
     for cmd, desc in update_commands:
         print(f"{command_sth}  {cmd:<30}{description_sth} - {desc}")
@@ -513,6 +898,7 @@ def show_ligma_help():
     print(f"\n{INFO_STYLE}Source Management:{RESET_STYLE}")
     source_commands = [
         ("ligma src add <user>/<repo>", "Add a package source"),
+        ("ligma src add <dir>", "Add a local directory as a source"),
         ("ligma src remove <user>/<repo>", "Remove a package source"),
         ("ligma src list", "List all package sources"),
         ("ligma src verified", "Show verified package sources"),
@@ -522,165 +908,2262 @@ def show_ligma_help():
     for cmd, desc in source_commands:
         print(f"{command_sth}  {cmd:<30}{description_sth} - {desc}")
 
-    # Help
-    print(f"\n{INFO_STYLE}Help and Version:{RESET_STYLE}")
-    help_commands = [
-        ("ligma ?h", "Show this help"),
-        ("ligma ?help", "Show this help"),
-        ("ligma ?v", "Show ligma version"),
-        ("ligma ?version", "Show ligma version")
-    ]
-    for cmd, desc in help_commands:
-        print(f"{command_sth}  {cmd:<30}{description_sth} - {desc}")
-    
-    print(f"\n{header_sth}╚{'═' * 58}╝{RESET_STYLE}")
+    # Help
+    print(f"\n{INFO_STYLE}Help and Version:{RESET_STYLE}")
+    help_commands = [
+        ("ligma ?h", "Show this help"),
+        ("ligma ?help", "Show this help"),
+        ("ligma ?v", "Show ligma version"),
+        ("ligma ?version", "Show ligma version")
+    ]
+    for cmd, desc in help_commands:
+        print(f"{command_sth}  {cmd:<30}{description_sth} - {desc}")
+    
+    print(f"\n{header_sth}╚{'═' * 58}╝{RESET_STYLE}")
+
+# Keep this for backward compatibility, redirects to the new browse_packages function
+def list_packages():
+    """Redirects to browse_packages for backward compatibility"""
+    browse_packages()
+
+def download_file(url, file_path):
+    """Download a single file and write it to disk
+    
+    The response is streamed to a .part file in DOWNLOAD_CHUNK_SIZE chunks, so
+    memory use doesn't depend on the file size. Dropped connections, timeouts,
+    truncated bodies and 5xx responses are retried with backoff, and a retry
+    continues the partial file with an HTTP Range request when the server
+    supports it. The file only appears at file_path once it is complete.
+    
+    Args:
+        url (str): URL of the file to download
+        file_path (str): Local path the file is written to
+    
+    Returns:
+        bool: True if the file was downloaded successfully
+    """
+    # Replace the directory entry instead of writing into the existing file,
+    # which may be a hardlink shared with the active package tree
+    temp_path = f"{file_path}.part"
+    try:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        if url.startswith("file://"):
+            # Files of local sources are copied straight from disk
+            shutil.copyfile(file_url_to_path(url), temp_path)
+            os.replace(temp_path, file_path)
+            return True
+    except Exception:
+        return False
+
+    received = 0
+    validator = None
+    last_error = None
+    try:
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            if attempt:
+                time.sleep(DOWNLOAD_BACKOFF * 2 ** (attempt - 1) + random.uniform(0, DOWNLOAD_BACKOFF))
+            headers = {}
+            if received and validator:
+                # If-Range makes the server send the whole file again if it changed meanwhile
+                headers = {'Range': f"bytes={received}-", 'If-Range': validator, 'Accept-Encoding': 'identity'}
+            try:
+                with _connection_budget, get_http_session().get(url, headers=headers, stream=True) as response:
+                    if response.status_code == 200:
+                        received = 0
+                        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                    elif response.status_code != 206:
+                        last_error = f"status code {response.status_code}"
+                        if response.status_code in RETRYABLE_STATUS_CODES:
+                            continue
+                        break
+                    expected = response.headers.get('Content-Length')
+                    if response.headers.get('Content-Encoding'):
+                        # The length of compressed bodies says nothing about the bytes written
+                        expected = None
+                    written = 0
+                    with open(temp_path, 'ab' if received else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            written += len(chunk)
+                            received += len(chunk)
+                    if expected is not None and written != int(expected):
+                        raise IOError(f"connection closed after {written} of {expected} bytes")
+                os.replace(temp_path, file_path)
+                return True
+            except (requests.RequestException, OSError) as e:
+                last_error = e
+        log_warning(f"Failed to download {url}: {last_error}")
+        return False
+    finally:
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+def download_files(jobs, workers=None, failed=None):
+    """Download several files concurrently using a bounded thread pool
+    
+    Args:
+        jobs (list): List of (url, file_path) tuples
+        workers (int, optional): Maximum number of parallel downloads. Defaults to DOWNLOAD_WORKERS.
+        failed (list, optional): If given, the file paths that failed are appended to it
+    
+    Returns:
+        tuple: (download_count, error_count)
+    """
+    if not jobs:
+        return 0, 0
+
+    workers = max(1, min(workers or DOWNLOAD_WORKERS, len(jobs)))
+    download_count = 0
+    error_count = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_file, url, file_path): file_path for url, file_path in jobs}
+        for future in as_completed(futures):
+            if future.result():
+                download_count += 1
+            else:
+                error_count += 1
+                if failed is not None:
+                    failed.append(futures[future])
+            report_install_progress(f"downloading {download_count + error_count}/{len(jobs)} files")
+
+    return download_count, error_count
+
+def is_local_source(source):
+    """Check whether a source is a directory on disk rather than a GitHub repository
+    
+    Local sources are file:// URLs, absolute paths or paths starting with
+    '.' or '~'; anything else is taken to be 'username/repo'.
+    """
+    return (source.startswith("file://") or os.path.isabs(source)
+            or source.startswith(('.', '~')))
+
+def file_url_to_path(url):
+    """Convert a file:// URL to a local path"""
+    return url2pathname(urlparse(url).path)
+
+def get_local_source_path(source):
+    """Get the directory of a local source"""
+    if source.startswith("file://"):
+        return file_url_to_path(source)
+    return os.path.abspath(os.path.expanduser(source))
+
+def normalize_source(source):
+    """Turn local paths into file:// URLs so each source has one spelling"""
+    if is_local_source(source):
+        return Path(get_local_source_path(source)).as_uri()
+    return source
+
+def read_local_source_file(source, path):
+    """Read a text file of a local source, returns None if it doesn't exist"""
+    file_path = os.path.join(get_local_source_path(source), *path.split('/'))
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def fetch_local_source_tree(source, ref=DEFAULT_REF, etag=None):
+    """List a local source directory the way the GitHub tree API lists a repository
+    
+    Instead of an ETag a fingerprint of all paths, sizes and modification
+    times is used, so an unchanged directory is recognised without hashing
+    any file.
+    
+    Returns:
+        tuple: (status_code, tree entries or None, fingerprint)
+    """
+    root = get_local_source_path(source)
+    # A directory has no branches or tags
+    if ref != DEFAULT_REF or not os.path.isdir(root):
+        return 404, None, etag
+
+    directories = []
+    files = []
+    fingerprint = hashlib.sha1()
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(name for name in dir_names if name != '.git')
+        rel_dir = os.path.relpath(dir_path, root).replace(os.sep, '/')
+        if rel_dir != '.':
+            directories.append(rel_dir)
+        for file_name in sorted(file_names):
+            path = file_name if rel_dir == '.' else f"{rel_dir}/{file_name}"
+            stat = os.stat(os.path.join(dir_path, file_name))
+            files.append((path, stat.st_size))
+            fingerprint.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+
+    fingerprint = f'"{fingerprint.hexdigest()}"'
+    if fingerprint == etag:
+        return 304, None, etag
+
+    tree = [{'path': path, 'type': 'tree', 'sha': None} for path in directories]
+    for path, size in files:
+        sha = compute_blob_sha(os.path.join(root, *path.split('/')))
+        tree.append({'path': path, 'type': 'blob', 'sha': sha, 'size': size})
+    tree.sort(key=lambda entry: entry['path'])
+    return 200, tree, fingerprint
+
+def load_user_settings():
+    """Load the SigmaOS user settings, re-reading user.sigs only when it changed"""
+    try:
+        mtime = os.path.getmtime(USER_SETTINGS_FILE)
+    except OSError:
+        return {}
+    if _user_settings_cache['mtime'] != mtime:
+        try:
+            with open(USER_SETTINGS_FILE, 'r') as f:
+                settings = json.load(f)
+        except Exception as e:
+            log_error("Error loading user settings", exception=e)
+            settings = {}
+        _user_settings_cache.update(mtime=mtime, settings=settings)
+    return _user_settings_cache['settings']
+
+def save_user_settings(settings):
+    """Save the SigmaOS user settings"""
+    with open(USER_SETTINGS_FILE, 'w') as f:
+        json.dump(settings, f, indent=4)
+
+def is_mirror_source(source):
+    """Check whether a source is a repository on a ligma mirror, like http://host:8765/user/repo"""
+    return source.startswith(("http://", "https://"))
+
+def get_source_endpoints(source):
+    """Get the API, raw file and archive base URLs and the repository name of a source
+    
+    Mirror sources are served by 'ligma mirror serve'. All other sources are
+    fetched from GitHub, unless user.sigs sets 'ligma_mirror', in which case
+    the same requests go to that mirror instead.
+    
+    Returns:
+        tuple: (api_url, raw_url, archive_url, repository)
+    """
+    if is_mirror_source(source):
+        parsed = urlparse(source)
+        base, repository = f"{parsed.scheme}://{parsed.netloc}", parsed.path.strip('/')
+    else:
+        base, repository = load_user_settings().get('ligma_mirror'), source
+    if base:
+        base = base.rstrip('/')
+        return f"{base}/api", f"{base}/raw", f"{base}/codeload", repository
+    return "https://api.github.com", "https://raw.githubusercontent.com", "https://codeload.github.com", repository
+
+def get_api_url(source, path):
+    """Build the URL of a GitHub API call for a source repository"""
+    api_url, _, _, repository = get_source_endpoints(source)
+    return f"{api_url}/repos/{repository}{path}"
+
+def get_github_token():
+    """Get the GitHub API token from the environment or the user settings, None if not set"""
+    return os.environ.get(GITHUB_TOKEN_ENV) or load_user_settings().get('github_token') or None
+
+def get_api_budget():
+    """Get the GitHub API budget reported by the last API response
+    
+    Returns:
+        dict: limit, remaining and reset (epoch seconds), each None until the first API call
+    """
+    with _api_budget_lock:
+        return {key: _api_budget[key] for key in ('limit', 'remaining', 'reset')}
+
+def update_api_budget(response):
+    """Record the X-RateLimit headers of a GitHub API response"""
+    headers = response.headers
+    if 'X-RateLimit-Remaining' not in headers:
+        return
+    try:
+        with _api_budget_lock:
+            _api_budget['limit'] = int(headers.get('X-RateLimit-Limit', _api_budget['limit'] or 0))
+            _api_budget['remaining'] = int(headers['X-RateLimit-Remaining'])
+            _api_budget['reset'] = int(headers.get('X-RateLimit-Reset', _api_budget['reset'] or 0))
+    except ValueError:
+        pass
+
+def get_api_pacing_delay():
+    """Get how long to wait before the next API call so a low budget lasts until the reset"""
+    with _api_budget_lock:
+        remaining, reset = _api_budget['remaining'], _api_budget['reset']
+    if remaining is None or reset is None or remaining >= API_LOW_BUDGET:
+        return 0
+    until_reset = max(0, reset - time.time())
+    if remaining == 0:
+        return until_reset
+    return min(until_reset / remaining, API_MAX_WAIT / API_LOW_BUDGET)
+
+def get_rate_limit_wait(response, attempt):
+    """Get how long to wait before retrying a rate-limited response, None if it isn't one
+    
+    GitHub answers exhausted budgets with 403 and X-RateLimit-Remaining: 0, and
+    secondary limits with 403 or 429 and a Retry-After header. Other 403s, like
+    a missing permission, are not retried.
+    """
+    if response.status_code not in (403, 429):
+        return None
+    retry_after = response.headers.get('Retry-After')
+    if retry_after and retry_after.isdigit():
+        wait = float(retry_after)
+    elif response.headers.get('X-RateLimit-Remaining') == '0':
+        wait = max(0, int(response.headers.get('X-RateLimit-Reset', 0)) - time.time())
+    elif response.status_code == 429:
+        wait = API_BACKOFF * 2 ** attempt
+    else:
+        return None
+    # Jitter keeps parallel installs from retrying in lockstep
+    return wait + random.uniform(0, API_BACKOFF * 2 ** attempt)
+
+def github_api_get(url, headers=None, **kwargs):
+    """GET a GitHub API URL, respecting the rate limit
+    
+    Sends the GitHub token if one is configured, records the remaining budget,
+    slows down when it runs low and retries rate-limited responses with
+    exponential backoff and jitter. Requests to a mirror go through the same
+    path but are never rate limited and never see the token.
+    
+    Args:
+        url (str): API URL, usually from get_api_url
+        headers (dict, optional): Extra request headers
+    
+    Returns:
+        requests.Response: The final response, which is still a 403/429 if the
+        budget doesn't reset within API_MAX_WAIT seconds
+    """
+    headers = dict(headers or {})
+    is_github = url.startswith("https://api.github.com/")
+    token = get_github_token() if is_github else None
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+
+    for attempt in range(API_MAX_RETRIES + 1):
+        if is_github:
+            delay = get_api_pacing_delay()
+            if 0 < delay <= API_MAX_WAIT:
+                report_install_progress("waiting for the GitHub API budget")
+                time.sleep(delay)
+
+        response = get_http_session().get(url, headers=headers, **kwargs)
+        if not is_github:
+            return response
+        update_api_budget(response)
+        if response.status_code == 401 and token:
+            log_warning("The GitHub token was rejected, check GITHUB_TOKEN or the github_token setting")
+
+        wait = get_rate_limit_wait(response, attempt)
+        if wait is None or attempt == API_MAX_RETRIES:
+            return response
+        if wait > API_MAX_WAIT:
+            with _api_budget_lock:
+                warned, _api_budget['warned'] = _api_budget['warned'], True
+            if not warned:
+                minutes = max(1, round(wait / 60))
+                hint = "" if token else f" Set {GITHUB_TOKEN_ENV} to raise the limit."
+                print(f"{WARNING_STYLE}GitHub API rate limit reached, it resets in about {minutes} min.{hint}{RESET_STYLE}")
+            log_warning(f"GitHub API rate limit reached for {url}, resets in {wait:.0f}s")
+            return response
+        log_warning(f"GitHub API rate limited ({response.status_code}), retrying in {wait:.1f}s")
+        time.sleep(wait)
+    return response
+
+def show_api_budget():
+    """Show the remaining GitHub API budget"""
+    budget = get_api_budget()
+    if budget['remaining'] is None:
+        # Checking the limit itself doesn't count against it
+        github_api_get("https://api.github.com/rate_limit")
+        budget = get_api_budget()
+    if budget['remaining'] is None:
+        print(f"{ERROR_STYLE}Could not reach the GitHub API.{RESET_STYLE}")
+        return
+    reset_in = max(0, (budget['reset'] or 0) - time.time())
+    style = WARNING_STYLE if budget['remaining'] < API_LOW_BUDGET else SUCCESS_STYLE
+    print(f"\n{INFO_STYLE}GitHub API:{RESET_STYLE}")
+    print(f"  ▶ {style}{budget['remaining']}/{budget['limit']} requests left{RESET_STYLE}, resets in {reset_in / 60:.0f} min")
+    if get_github_token():
+        print(f"  ▶ Authenticated with a token")
+    else:
+        print(f"  ▶ Anonymous. Set {GITHUB_TOKEN_ENV} or the 'github_token' setting for 5000 requests per hour.")
+
+def get_ordered_sources():
+    """Load the configured sources with the official repository first
+    
+    With ORDER_SOURCES_BY_LATENCY the other sources follow fastest first by
+    their latency score; sources that were never measured keep their
+    configured order behind them.
+    """
+    sources = load_sources()
+    if OFFICIAL_REPO in sources:
+        sources.remove(OFFICIAL_REPO)
+        sources.insert(0, OFFICIAL_REPO)
+    if ORDER_SOURCES_BY_LATENCY and len(sources) > 2:
+        latency = get_source_latencies()
+        first = sources[:1] if sources[0] == OFFICIAL_REPO else []
+        others = sources[len(first):]
+        sources = first + sorted(others, key=lambda source: latency.get(source, float('inf')))
+    return sources
+
+def get_catalog_path(source, ref=DEFAULT_REF):
+    """Get the path of the on-disk catalog file of a source"""
+    safe_name = source.replace('\\', '/').replace('/', '__').replace(':', '_')
+    safe_ref = ref.replace('/', '__')
+    return os.path.join(CATALOG_DIR, f"{safe_name}@{safe_ref}.json")
+
+def load_catalog(source, ref=DEFAULT_REF):
+    """Load the catalog of a source from memory or disk, returns None if there is none"""
+    key = (source, ref)
+    if key in _catalog_cache:
+        return _catalog_cache[key]
+
+    catalog_path = get_catalog_path(source, ref)
+    if not os.path.exists(catalog_path):
+        return None
+    try:
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    except Exception as e:
+        log_error(f"Error loading catalog of {source}", exception=e)
+        return None
+    _catalog_cache[key] = catalog
+    return catalog
+
+def save_catalog(catalog):
+    """Write a catalog to disk, replacing the previous file atomically"""
+    _catalog_cache[(catalog['source'], catalog['ref'])] = catalog
+    try:
+        os.makedirs(CATALOG_DIR, exist_ok=True)
+        catalog_path = get_catalog_path(catalog['source'], catalog['ref'])
+        temp_path = f"{catalog_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f)
+        os.replace(temp_path, catalog_path)
+        return True
+    except Exception as e:
+        log_error(f"Error saving catalog of {catalog['source']}", exception=e)
+        return False
+
+def fetch_source_tree(source, ref=DEFAULT_REF, etag=None):
+    """Fetch the complete file tree of a source repository with a single request
+    
+    Args:
+        source (str): The source repository in format username/repo
+        ref (str): Branch, tag or commit to list
+        etag (str, optional): ETag of a previously fetched tree for conditional revalidation
+    
+    Returns:
+        tuple: (status_code, tree entries or None, etag)
+    """
+    if is_local_source(source):
+        return fetch_local_source_tree(source, ref, etag)
+    url = get_api_url(source, f"/git/trees/{quote(ref)}?recursive=1")
+    headers = {'Accept': 'application/vnd.github.v3+json'}
+    if etag:
+        headers['If-None-Match'] = etag
+    try:
+        response = github_api_get(url, headers=headers)
+    except requests.RequestException:
+        record_source_latency(source, SOURCE_DEADLINE)
+        raise
+    record_source_latency(source, response.elapsed.total_seconds())
+    if response.status_code != 200:
+        return response.status_code, None, etag
+
+    data = response.json()
+    if data.get('truncated'):
+        log_warning(f"Tree listing for {source}@{ref} was truncated by GitHub, some files may be missing")
+    return 200, data.get('tree', []), response.headers.get('ETag')
+
+def fetch_source_head(source, ref=DEFAULT_REF, etag=None):
+    """Fetch the commit SHA a branch, tag or commit of a source points to
+    
+    Args:
+        source (str): The source repository in format username/repo
+        ref (str): Branch, tag or commit to resolve
+        etag (str, optional): ETag of a previous answer for conditional revalidation
+    
+    Returns:
+        tuple: (status_code, commit SHA or None, etag)
+    """
+    url = get_api_url(source, f"/commits/{quote(ref)}")
+    headers = {'Accept': 'application/vnd.github.sha'}
+    if etag:
+        headers['If-None-Match'] = etag
+    try:
+        response = github_api_get(url, headers=headers)
+    except requests.RequestException:
+        record_source_latency(source, SOURCE_DEADLINE)
+        raise
+    record_source_latency(source, response.elapsed.total_seconds())
+    if response.status_code != 200:
+        return response.status_code, None, etag
+    return 200, response.text.strip(), response.headers.get('ETag')
+
+def fetch_source_commit(source, ref=DEFAULT_REF):
+    """Resolve a branch, tag or commit of a source to the full commit SHA, None on failure"""
+    if is_immutable_ref(ref):
+        return ref
+    if is_local_source(source):
+        return None
+    try:
+        _, commit, _ = fetch_source_head(source, ref)
+    except Exception as e:
+        log_warning(f"Could not resolve {source}@{ref} to a commit: {e}")
+        return None
+    return commit
+
+def split_package_spec(spec):
+    """Split an install spec like 'name@v1.2' into (name, ref); ref is None if not given"""
+    name, separator, ref = spec.partition('@')
+    return name, (ref or None) if separator else None
+
+def is_immutable_ref(ref):
+    """Check whether a ref is a full commit SHA, whose content can never change"""
+    return bool(ref and re.fullmatch(r"[0-9a-f]{40}", ref))
+
+def load_refs_cache():
+    """Load the resolved tags and abbreviated SHAs, keyed by 'source@ref'
+    
+    Refs known to be branches map to {'branch': True, 'checked': timestamp}
+    instead of a commit SHA.
+    """
+    try:
+        with open(REFS_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_refs_cache(cache):
+    """Save the resolved refs atomically"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(f"{REFS_CACHE_FILE}.part", 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(f"{REFS_CACHE_FILE}.part", REFS_CACHE_FILE)
+    except Exception as e:
+        log_error("Error saving resolved refs", exception=e)
+
+def resolve_ref(source, ref):
+    """Turn the ref an install asked for into the ref content is fetched from
+    
+    Tags and abbreviated SHAs are resolved to their full commit SHA once and
+    remembered for good, which makes everything fetched for them immutable
+    and cacheable without revalidation. Branches are returned unchanged and
+    keep tracking their latest commit.
+    
+    Args:
+        source (str): The source repository in format username/repo
+        ref (str): Branch, tag or (abbreviated) commit SHA
+    
+    Returns:
+        str: Full commit SHA for pinned refs, the branch name otherwise
+    """
+    if ref == DEFAULT_REF or is_immutable_ref(ref) or is_local_source(source):
+        return ref
+
+    key = f"{source}@{ref}"
+    with _refs_lock:
+        cached = load_refs_cache().get(key)
+    if isinstance(cached, str):
+        return cached
+    if cached and time.time() - cached.get('checked', 0) < BRANCH_REF_TTL:
+        return ref
+
+    try:
+        response = github_api_get(get_api_url(source, f"/git/ref/tags/{quote(ref)}"))
+        is_tag = response.status_code == 200
+    except Exception as e:
+        log_warning(f"Could not look up {ref} in {source}: {e}")
+        return ref
+    if not is_tag and not re.fullmatch(r"[0-9a-f]{7,39}", ref):
+        if response.status_code == 404:
+            with _refs_lock:
+                cache = load_refs_cache()
+                cache[key] = {'branch': True, 'checked': time.time()}
+                save_refs_cache(cache)
+        return ref
+
+    commit = fetch_source_commit(source, ref)
+    if not commit:
+        return ref
+    with _refs_lock:
+        cache = load_refs_cache()
+        cache[key] = commit
+        save_refs_cache(cache)
+    log_info(f"Pinned {source}@{ref} to commit {commit}")
+    return commit
+
+def fetch_package_descriptions(source, descriptions, ref=DEFAULT_REF):
+    """Download and parse several description.txt files concurrently
+    
+    Args:
+        source (str): The source repository in format username/repo
+        descriptions (dict): Maps package names to the path of their description.txt
+        ref (str): Branch, tag or commit to read from
+    
+    Returns:
+        dict: Maps package names to parsed descriptions; failed downloads are left out
+    """
+    def fetch(path):
+        if is_local_source(source):
+            content = read_local_source_file(source, path)
+            return parse_description_file(content) if content is not None else None
+        response = get_http_session().get(get_raw_file_url(source, path, ref))
+        if response.status_code == 200:
+            return parse_description_file(response.text)
+        return None
+
+    parsed = {}
+    if not descriptions:
+        return parsed
+    with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(descriptions))) as executor:
+        futures = {executor.submit(fetch, path): pkg for pkg, path in descriptions.items()}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception:
+                result = None
+            if result is not None:
+                parsed[futures[future]] = result
+    return parsed
+
+def _get_catalog_lock(source, ref):
+    with _catalog_locks_lock:
+        return _catalog_locks.setdefault((source, ref), threading.Lock())
+
+def get_catalog(source, ref=DEFAULT_REF, max_age=None, force=False, descriptions=True):
+    """Get the catalog of a source, revalidating it when it is older than max_age
+    
+    The catalog holds the repository tree and the parsed description of every
+    package. Revalidation asks for the commit the branch points to with the
+    stored ETag, so an unchanged repository costs a single 304 response; only
+    when the branch moved is the tree of its new commit listed, and only
+    descriptions whose blob SHA changed are downloaded again. If the source can't be reached the stored catalog is
+    returned as is.
+    
+    Args:
+        source (str): The source repository in format username/repo
+        ref (str): Branch, tag or commit of the catalog
+        max_age (int, optional): Maximum age in seconds. Defaults to CATALOG_TTL.
+        force (bool): Revalidate even if the catalog is still fresh
+        descriptions (bool): Whether package descriptions have to be up to date
+    
+    Returns:
+        dict: The catalog, or None if it is neither cached nor reachable
+    """
+    max_age = CATALOG_TTL if max_age is None else max_age
+    with _get_catalog_lock(source, ref):
+        catalog = load_catalog(source, ref)
+        # The tree of a commit never changes, so its catalog is never revalidated
+        is_fresh = catalog is not None and (is_immutable_ref(ref) or time.time() - catalog.get('checked_at', 0) < max_age)
+        if is_fresh and not force and (catalog.get('complete') or not descriptions):
+            return catalog
+
+        head_etag = None
+        try:
+            if is_local_source(source) or is_immutable_ref(ref):
+                # Local trees are revalidated by their fingerprint, commit trees never change
+                commit = ref if is_immutable_ref(ref) else None
+                status, tree, etag = fetch_source_tree(source, ref, catalog.get('etag') if catalog else None)
+            else:
+                status, commit, head_etag = fetch_source_head(source, ref, catalog.get('head_etag') if catalog else None)
+                if status == 200 and catalog is not None and commit == catalog.get('commit'):
+                    status = 304
+                if status == 200:
+                    status, tree, etag = fetch_source_tree(source, commit)
+        except Exception as e:
+            log_warning(f"Could not reach {source}, using cached catalog: {e}")
+            return catalog
+
+        if status == 304 and catalog is not None:
+            catalog['checked_at'] = time.time()
+            if head_etag:
+                catalog['head_etag'] = head_etag
+        elif status == 200:
+            old_packages = catalog.get('packages', {}) if catalog else {}
+            packages = {}
+            for entry in tree:
+                path = entry['path']
+                if entry['type'] == 'tree' and '/' not in path and not path.startswith('.'):
+                    packages[path] = {'desc_sha': None}
+            for entry in tree:
+                pkg, _, rest = entry['path'].partition('/')
+                if rest == "description.txt" and pkg in packages:
+                    packages[pkg]['desc_sha'] = entry['sha']
+            # Carry over descriptions whose blob hasn't changed
+            for pkg, info in packages.items():
+                old = old_packages.get(pkg)
+                if old and old.get('desc_sha') == info['desc_sha'] and 'dependencies' in old:
+                    packages[pkg] = old
+            catalog = {
+                'source': source,
+                'ref': ref,
+                'etag': etag,
+                'head_etag': head_etag,
+                'checked_at': time.time(),
+                'tree': tree,
+                'commit': commit,
+                'packages': packages,
+                'complete': False
+            }
+        else:
+            log_warning(f"Could not list {source}@{ref}. Status code: {status}")
+            return catalog
+
+        if descriptions and not catalog.get('complete'):
+            missing = {pkg: f"{pkg}/description.txt" for pkg, info in catalog['packages'].items()
+                       if 'description' not in info and info.get('desc_sha')}
+            parsed = fetch_package_descriptions(source, missing, ref)
+            for pkg, desc in parsed.items():
+                catalog['packages'][pkg].update(desc)
+            catalog['complete'] = len(parsed) == len(missing)
+
+        update_search_index(catalog)
+        save_catalog(catalog)
+        return catalog
+
+def get_source_commit(source, ref=DEFAULT_REF):
+    """Get the commit the cached tree of a source belongs to, or None if unknown"""
+    catalog = load_catalog(source, resolve_ref(source, ref))
+    return catalog.get('commit') if catalog else None
+
+def get_source_tree(source, ref=DEFAULT_REF):
+    """Get the complete file tree of a source repository
+    
+    The tree comes from the source catalog and is revalidated once it is
+    older than TREE_CACHE_TTL, so several installs share one listing.
+    
+    Returns:
+        list: Tree entries (dicts with path, type, sha and size) or None on failure
+    """
+    catalog = get_catalog(source, resolve_ref(source, ref), max_age=TREE_CACHE_TTL, descriptions=False)
+    return catalog['tree'] if catalog else None
+
+def find_catalog_package(package_name, source=None, max_age=None):
+    """Look up a package in the source catalogs
+    
+    Args:
+        package_name (str): Name of the package
+        source (str, optional): Specific source to check. If None, checks all sources in priority order.
+        max_age (int, optional): Maximum catalog age in seconds. Defaults to CATALOG_TTL.
+    
+    Returns:
+        tuple: (source, catalog entry) or (None, None) if the package wasn't found
+    """
+    for src in ([source] if source else get_ordered_sources()):
+        catalog = get_catalog(src, max_age=max_age)
+        if catalog and package_name in catalog['packages']:
+            return src, catalog['packages'][package_name]
+    return None, None
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric search tokens"""
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def get_package_terms(package_name, info):
+    """Get the weighted search terms of a catalog package
+    
+    Returns:
+        dict: Maps each token to the highest weight it appears with
+    """
+    terms = {}
+    fields = [
+        ('name', package_name),
+        ('author', info.get('author', '')),
+        ('description', info.get('description', ''))
+    ]
+    for field, text in fields:
+        for token in tokenize(text):
+            terms[token] = max(terms.get(token, 0), SEARCH_WEIGHTS[field])
+    # Also index the full package name so names like "SigmaUpdate" match as a whole
+    terms[package_name.lower()] = SEARCH_WEIGHTS['name']
+    return terms
+
+def update_search_index(catalog):
+    """Bring the search index of a catalog in line with its packages
+    
+    Only packages that were added, removed or whose description blob changed
+    are re-indexed.
+    
+    Args:
+        catalog (dict): Catalog as returned by get_catalog, updated in place
+    """
+    index = catalog.setdefault('index', {'shas': {}, 'terms': {}, 'postings': {}})
+    shas, terms, postings = index['shas'], index['terms'], index['postings']
+    packages = catalog['packages']
+
+    def remove(pkg):
+        for token in terms.pop(pkg, {}):
+            posting = postings.get(token)
+            if posting:
+                posting.pop(pkg, None)
+                if not posting:
+                    del postings[token]
+        shas.pop(pkg, None)
+
+    for pkg in list(shas):
+        if pkg not in packages or packages[pkg].get('desc_sha') != shas[pkg]:
+            remove(pkg)
+
+    for pkg, info in packages.items():
+        if pkg in shas:
+            continue
+        package_terms = get_package_terms(pkg, info)
+        for token, weight in package_terms.items():
+            postings.setdefault(token, {})[pkg] = weight
+        terms[pkg] = package_terms
+        shas[pkg] = info.get('desc_sha') if 'description' in info else None
+
+    _vocabulary_cache.pop((catalog['source'], catalog['ref']), None)
+
+def search_catalog(catalog, query):
+    """Search a catalog with its inverted index
+    
+    Every query term has to match a token of the package exactly or as a
+    prefix, or appear inside the package name. Exact matches score higher
+    than prefix matches.
+    
+    Args:
+        catalog (dict): Catalog as returned by get_catalog
+        query (str): Search query, may contain several terms
+    
+    Returns:
+        dict: Maps matching package names to their relevance score
+    """
+    if 'index' not in catalog:
+        update_search_index(catalog)
+    postings = catalog['index']['postings']
+
+    key = (catalog['source'], catalog['ref'])
+    vocabulary = _vocabulary_cache.get(key)
+    if vocabulary is None:
+        vocabulary = sorted(postings)
+        _vocabulary_cache[key] = vocabulary
+
+    scores = None
+    for term in tokenize(query):
+        term_scores = {}
+        start = bisect.bisect_left(vocabulary, term)
+        for token in vocabulary[start:bisect.bisect_left(vocabulary, term + "\uffff")]:
+            factor = 1.0 if token == term else 0.5
+            for pkg, weight in postings[token].items():
+                term_scores[pkg] = max(term_scores.get(pkg, 0), weight * factor)
+        for pkg in catalog['packages']:
+            if pkg not in term_scores and term in pkg.lower():
+                term_scores[pkg] = SEARCH_WEIGHTS['name'] * 0.25
+
+        if scores is None:
+            scores = term_scores
+        else:
+            scores = {pkg: score + term_scores[pkg] for pkg, score in scores.items() if pkg in term_scores}
+        if not scores:
+            return {}
+
+    return scores or {}
+
+def refresh_catalogs():
+    """Force a rebuild of the catalogs of all configured sources"""
+    sources = get_ordered_sources()
+    print(f"{INFO_STYLE}Refreshing catalogs of {len(sources)} source(s)...{RESET_STYLE}")
+    for source in sources:
+        start_time = time.time()
+        catalog = get_catalog(source, force=True)
+        if catalog:
+            print(f"{SUCCESS_STYLE}  ▶ {source}: {len(catalog['packages'])} packages ({time.time() - start_time:.2f}s){RESET_STYLE}")
+        else:
+            print(f"{ERROR_STYLE}  ▶ {source}: could not be refreshed{RESET_STYLE}")
+    budget = get_api_budget()
+    if budget['remaining'] is not None:
+        print(f"{INFO_STYLE}GitHub API requests left: {budget['remaining']}/{budget['limit']}{RESET_STYLE}")
+    log_info(f"Refreshed catalogs of {len(sources)} sources")
+
+def get_package_files(tree, package_name):
+    """Get all files of a package from a repository tree
+    
+    Args:
+        tree (list): Tree entries as returned by get_source_tree
+        package_name (str): Name of the package (top-level directory)
+    
+    Returns:
+        dict: Maps each file path relative to the package directory to its tree entry
+    """
+    prefix = f"{package_name}/"
+    return {entry['path'][len(prefix):]: entry for entry in tree
+            if entry['type'] == 'blob' and entry['path'].startswith(prefix)}
+
+def get_raw_file_url(source, path, ref=DEFAULT_REF):
+    """Build the raw download URL for a file in a source repository"""
+    if is_local_source(source):
+        return Path(get_local_source_path(source), *path.split('/')).as_uri()
+    _, raw_url, _, repository = get_source_endpoints(source)
+    return f"{raw_url}/{repository}/{quote(ref)}/{quote(path)}"
+
+def resolve_package_source(package_name, sources=None, ref=DEFAULT_REF):
+    """Find the highest-priority source that provides a package
+    
+    Args:
+        package_name (str): Name of the package
+        sources (list, optional): Sources in priority order. Defaults to all configured sources.
+        ref (str): Branch, tag or commit the package has to exist in
+    
+    Returns:
+        tuple: (source, files) where files maps paths to tree entries, or (None, None)
+    """
+    sources = get_ordered_sources() if sources is None else sources
+
+    def probe(source, cancel_event=None):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        tree = get_source_tree(source, ref)
+        if tree is None:
+            return None
+        files = get_package_files(tree, package_name)
+        if not files:
+            record_package_miss(package_name, source, ref)
+        return files or None
+
+    for group in plan_source_lookup(package_name, sources, ref):
+        if SOURCE_RACING and len(group) > 1:
+            source, files = race_sources(group, probe)
+            if files:
+                record_package_source(package_name, source, ref)
+                return source, files
+            continue
+
+        for source in group:
+            files = probe(source)
+            if files:
+                record_package_source(package_name, source, ref)
+                return source, files
+    return None, None
+
+def scan_installed_packages():
+    """Scan PACKAGES_DIR for installed packages and their entry points
+    
+    A package named 'pkg' runs pkg/main.py, 'pkg.file' runs pkg/file.py and
+    'pkg.dir1.dir2.file' runs pkg/dir1/dir2/file.py. Directories are resolved
+    with get_package_dir, so a package in the middle of a version switch is
+    found at the version that is still active.
+    
+    Returns:
+        dict: Maps each package name to its directory and entry points
+        (command name to script path)
+    """
+    names = []
+    for parent_dir in (PACKAGES_DIR, VERSIONS_DIR):
+        if os.path.isdir(parent_dir):
+            names.extend(entry.name for entry in os.scandir(parent_dir)
+                         if entry.is_dir() and not entry.name.startswith('.') and entry.name != "SigmaOS-packages-main")
+    packages = {}
+    for name in dict.fromkeys(names):
+        package_dir = get_package_dir(name)
+        if not os.path.isdir(package_dir):
+            continue
+        packages[name] = {'dir': package_dir, 'entry_points': scan_package_entry_points(name, package_dir),
+                          'misses': {}}
+    return packages
+
+def scan_package_entry_points(package_name, package_dir):
+    """Map every command of one package to the script it runs"""
+    entry_points = {}
+    for dirpath, dirnames, filenames in os.walk(package_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != "__pycache__"]
+        rel_dir = os.path.relpath(dirpath, package_dir)
+        prefix = [package_name] if rel_dir == "." else [package_name, *rel_dir.split(os.sep)]
+        for filename in filenames:
+            if not filename.endswith(".py"):
+                continue
+            script = os.path.join(dirpath, filename)
+            if rel_dir == "." and filename == "main.py":
+                entry_points[os.path.normcase(package_name)] = script
+            entry_points[os.path.normcase(".".join(prefix + [filename[:-3]]))] = script
+    return entry_points
+
+def get_package_registry(force=False):
+    """Get the registry of installed packages, rescanning only when something changed
+    
+    The registry is rebuilt after ligma installs, updates, switches or removes
+    a package, and when the mtime of PACKAGES_DIR shows that another process
+    did. Within REGISTRY_CHECK_INTERVAL of the last check no syscall is made,
+    unless the last scan caught a package in the middle of a version switch.
+    
+    Args:
+        force (bool): Rescan PACKAGES_DIR even if nothing seems to have changed
+    
+    Returns:
+        dict: As returned by scan_installed_packages
+    """
+    global _package_registry
+    with _package_registry_lock:
+        registry = _package_registry
+        now = time.time()
+        # While a package is being switched the registry is checked on every lookup
+        if (registry is not None and not force and not registry['switching']
+                and now - registry['checked_at'] < REGISTRY_CHECK_INTERVAL):
+            return registry['packages']
+        try:
+            mtime = os.stat(PACKAGES_DIR).st_mtime_ns
+        except OSError:
+            mtime = None
+        if registry is None or force or registry['mtime'] != mtime:
+            packages = scan_installed_packages()
+            switching = any(package['dir'] != os.path.join(PACKAGES_DIR, name) for name, package in packages.items())
+            registry = {'mtime': mtime, 'packages': packages, 'switching': switching}
+            _package_registry = registry
+        registry['checked_at'] = now
+        return registry['packages']
+
+def invalidate_package_registry():
+    """Make the next registry lookup rescan PACKAGES_DIR, called after every install event"""
+    global _package_registry
+    with _package_registry_lock:
+        _package_registry = None
+
+def refresh_package_entry_points(package_name, command):
+    """Rescan one installed package for scripts added or removed inside it
+    
+    Args:
+        package_name (str): Name of the package
+        command (str): The command that wasn't found; if it already caused a
+            rescan within REGISTRY_CHECK_INTERVAL the package isn't scanned again
+    
+    Returns:
+        dict: The registry entry of the package, None if it isn't installed
+    """
+    with _package_registry_lock:
+        package = get_package_registry().get(package_name)
+        if package is None:
+            return None
+        now = time.time()
+        if now - package['misses'].get(command, 0) >= REGISTRY_CHECK_INTERVAL:
+            package['entry_points'] = scan_package_entry_points(package_name, package['dir'])
+            package['misses'][command] = now
+        return package
+
+def get_package_entry_point(command):
+    """Get the script a package command like 'pkg' or 'pkg.dir.file' runs, None if there is none"""
+    package_name = command.split('.')[0]
+    package = get_package_registry().get(package_name)
+    if package is None:
+        return None
+    script = package['entry_points'].get(os.path.normcase(command))
+    if script is None:
+        # The script may have been added to the package since it was scanned
+        package = refresh_package_entry_points(package_name, command)
+        if package is not None:
+            script = package['entry_points'].get(os.path.normcase(command))
+    return script
+
+def get_installed_packages():
+    """Get the names of all installed packages"""
+    return list(get_package_registry())
+
+def is_package_installed(package_name):
+    """Check if a package is installed, whether or not it has a runnable entry point"""
+    return package_name in get_package_registry()
+
+def compute_blob_sha(file_path):
+    """Compute the git blob SHA of a local file, as git hash-object would"""
+    sha = hashlib.sha1(f"blob {os.path.getsize(file_path)}\0".encode())
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def scan_package_files(package_dir):
+    """Compute the blob SHAs of the files of a package directory
+    
+    Used for packages installed before manifests were recorded. Bytecode
+    caches and the manifest itself are ignored.
+    
+    Returns:
+        dict: Maps each path relative to the package directory to its blob SHA
+    """
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(package_dir):
+        dir_names[:] = [d for d in dir_names if d != "__pycache__"]
+        for file_name in file_names:
+            if file_name == MANIFEST_FILE or file_name.endswith(".pyc"):
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            rel_path = os.path.relpath(file_path, package_dir).replace(os.sep, '/')
+            files[rel_path] = compute_blob_sha(file_path)
+    return files
+
+def load_package_manifest(package_name, package_dir=None):
+    """Load the manifest of an installed package, returns None if it has none"""
+    package_dir = package_dir or os.path.join(PACKAGES_DIR, package_name)
+    manifest_path = os.path.join(package_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        log_error(f"Error reading manifest of {package_name}", exception=e)
+        return None
+
+def write_package_manifest(package_name, package_dir, source, files, ref=DEFAULT_REF, commit=None):
+    """Record the source and file blob SHAs of an installed package
+    
+    Args:
+        package_name (str): Name of the package
+        package_dir (str): Directory the package was installed into
+        source (str): Source the package was installed from
+        files (dict): Maps paths relative to the package directory to blob SHAs
+        ref (str): Branch, tag or commit the package was installed from
+        commit (str, optional): Commit SHA ref pointed to at install time
+    """
+    manifest = {
+        'name': package_name,
+        'source': source,
+        'ref': ref,
+        'commit': commit,
+        'installed_at': time.time(),
+        'files': files
+    }
+    manifest_path = os.path.join(package_dir, MANIFEST_FILE)
+    try:
+        # A cloned staging tree shares the old manifest with the active tree through a hardlink
+        with open(f"{manifest_path}.part", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(f"{manifest_path}.part", manifest_path)
+    except Exception as e:
+        log_error(f"Error writing manifest of {package_name}", exception=e)
+
+def get_local_package_files(package_name):
+    """Get the source and file blob SHAs of an installed package
+    
+    Returns:
+        tuple: (source or None, dict mapping relative paths to blob SHAs)
+    """
+    manifest = load_package_manifest(package_name)
+    if manifest is not None:
+        return manifest.get('source'), manifest.get('files', {})
+    return None, scan_package_files(os.path.join(PACKAGES_DIR, package_name))
+
+def diff_package_files(local_files, remote_files):
+    """Compare local blob SHAs with the files of a package in a repository tree
+    
+    Args:
+        local_files (dict): Maps relative paths to local blob SHAs
+        remote_files (dict): Maps relative paths to tree entries, as returned by get_package_files
+    
+    Returns:
+        dict: Sorted lists of 'added', 'changed' and 'removed' relative paths
+    """
+    return {
+        'added': sorted(path for path in remote_files if path not in local_files),
+        'changed': sorted(path for path, entry in remote_files.items()
+                          if path in local_files and local_files[path] != entry['sha']),
+        'removed': sorted(path for path in local_files if path not in remote_files)
+    }
+
+def find_package_updates(package_names):
+    """Detect outdated packages with one tree listing per source
+    
+    Args:
+        package_names (list): Names of installed packages to check
+    
+    Returns:
+        tuple: (dict mapping outdated packages to (source, changes, remote files),
+                list of packages that couldn't be checked)
+    """
+    local_state = {pkg: get_local_package_files(pkg) for pkg in package_names}
+    trees = {}
+    updates = {}
+    errors = []
+
+    for pkg, (source, local_files) in local_state.items():
+        manifest = load_package_manifest(pkg) or {}
+        ref = manifest.get('ref', DEFAULT_REF)
+        # Packages pinned to a commit never have updates
+        if is_immutable_ref(ref):
+            continue
+        # Packages without a manifest are looked up in the sources by priority
+        if source:
+            candidates = [source]
+        else:
+            candidates = [src for group in plan_source_lookup(pkg, get_ordered_sources(), ref) for src in group]
+        remote_files = None
+        for candidate in candidates:
+            if (candidate, ref) not in trees:
+                trees[(candidate, ref)] = get_source_tree(candidate, ref)
+            tree = trees[(candidate, ref)]
+            if tree is None:
+                continue
+            remote_files = get_package_files(tree, pkg)
+            if remote_files:
+                source = candidate
+                break
+        if not remote_files:
+            errors.append(pkg)
+            continue
+
+        changes = diff_package_files(local_files, remote_files)
+        if any(changes.values()):
+            updates[pkg] = (source, changes, remote_files)
+
+    return updates, errors
+
+def print_package_changes(changes, indent="    "):
+    """Print the added, changed and removed files of a package update"""
+    for label, key, style in (("+", 'added', SUCCESS_STYLE), ("~", 'changed', WARNING_STYLE), ("-", 'removed', ERROR_STYLE)):
+        for path in changes[key]:
+            print(f"{style}{indent}{label} {path}{RESET_STYLE}")
+
+def link_or_copy(src_path, dst_path):
+    """Hardlink a file, falling back to a copy where hardlinks aren't supported"""
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copy2(src_path, dst_path)
+
+def get_blob_path(sha):
+    """Get the path of a blob in the blob store"""
+    return os.path.join(BLOBS_DIR, sha[:2], sha)
+
+def get_blob_signature(blob_path):
+    """Get the [size, mtime, inode] a blob record holds"""
+    stat = os.stat(blob_path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+def write_blob_record(sha):
+    """Record the current stat of a blob that was just verified"""
+    record_path = get_blob_path(sha) + BLOB_RECORD_SUFFIX
+    temp_path = f"{record_path}.{threading.get_ident()}.part"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(get_blob_signature(get_blob_path(sha)), f)
+    os.replace(temp_path, record_path)
+
+def read_blob_record(sha):
+    """Get the recorded stat of a blob, None if it has no record"""
+    try:
+        with open(get_blob_path(sha) + BLOB_RECORD_SUFFIX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def store_blob(file_path, sha):
+    """Add a downloaded file to the blob store
+    
+    The file is hardlinked (or copied) into the store, but only if its
+    content really hashes to sha.
+    
+    Returns:
+        bool: True if the blob is in the store afterwards
+    """
+    blob_path = get_blob_path(sha)
+    if os.path.exists(blob_path):
+        return True
+    try:
+        if compute_blob_sha(file_path) != sha:
+            log_warning(f"Not storing {file_path}, content doesn't match blob {sha}")
+            return False
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        temp_path = f"{blob_path}.{threading.get_ident()}.part"
+        link_or_copy(file_path, temp_path)
+        os.replace(temp_path, blob_path)
+        write_blob_record(sha)
+        return True
+    except OSError as e:
+        log_error(f"Error storing blob {sha}", exception=e)
+        return False
+
+def verify_stored_blob(sha):
+    """Check that a stored blob still has the content its SHA names
+    
+    Blobs whose stat no longer matches their record are hashed again, a blob
+    that no longer matches its SHA is dropped from the store.
+    
+    Returns:
+        bool: True if the blob is in the store and intact
+    """
+    blob_path = get_blob_path(sha)
+    try:
+        if get_blob_signature(blob_path) == read_blob_record(sha):
+            return True
+        if compute_blob_sha(blob_path) == sha:
+            write_blob_record(sha)
+            return True
+        log_warning(f"Blob {sha} was modified in place, removing it from the store")
+        os.remove(blob_path)
+        if os.path.exists(blob_path + BLOB_RECORD_SUFFIX):
+            os.remove(blob_path + BLOB_RECORD_SUFFIX)
+    except OSError:
+        pass
+    return False
+
+def materialize_blob(sha, file_path, size=None):
+    """Place a blob from the store at file_path, hardlinked where possible
+    
+    Args:
+        sha (str): Git blob SHA of the file
+        file_path (str): Where the file should appear
+        size (int, optional): Expected size, a blob of a different size is ignored
+    
+    Returns:
+        bool: False if the store doesn't have the blob
+    """
+    blob_path = get_blob_path(sha)
+    try:
+        if size is not None and os.path.getsize(blob_path) != size:
+            verify_stored_blob(sha)
+            return False
+        if not verify_stored_blob(sha):
+            return False
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # Replace the directory entry, the existing file may be linked elsewhere
+        temp_path = f"{file_path}.part"
+        link_or_copy(blob_path, temp_path)
+        os.replace(temp_path, file_path)
+        return True
+    except OSError:
+        return False
+
+def file_matches_blob(file_path, sha):
+    """Check that a file has the content of blob sha
+    
+    A file that is a hardlink of an intact stored blob is trusted without
+    reading it, any other file is hashed.
+    
+    Returns:
+        bool: True if the file exists and matches
+    """
+    try:
+        if verify_stored_blob(sha) and os.path.samefile(file_path, get_blob_path(sha)):
+            return True
+        return compute_blob_sha(file_path) == sha
+    except OSError:
+        return False
+
+def fetch_package_files(source, package_dir, files, rel_paths, workers=None, failed=None, ref=DEFAULT_REF):
+    """Put files of a package tree into package_dir, downloading only blobs the store lacks
+    
+    Args:
+        source (str): The source repository in format username/repo
+        package_dir (str): Directory the files are written to
+        files (dict): Maps relative paths to tree entries, as returned by get_package_files
+        rel_paths (list): The relative paths to fetch
+        workers (int, optional): Number of parallel file downloads. Defaults to DOWNLOAD_WORKERS.
+        failed (list, optional): If given, the file paths that failed are appended to it
+        ref (str): Branch, tag or commit missing blobs are downloaded from
+    
+    Returns:
+        tuple: (download_count, error_count, reused_count)
+    """
+    jobs = []
+    shas = {}
+    reused_count = 0
+    for rel_path in rel_paths:
+        entry = files[rel_path]
+        file_path = os.path.join(package_dir, *rel_path.split('/'))
+        if materialize_blob(entry['sha'], file_path, entry.get('size')):
+            reused_count += 1
+            continue
+        jobs.append((get_raw_file_url(source, entry['path'], ref), file_path))
+        shas[file_path] = entry['sha']
+
+    failed_paths = []
+    download_count, error_count = download_files(jobs, workers, failed_paths)
+    for file_path, sha in shas.items():
+        if file_path not in failed_paths:
+            store_blob(file_path, sha)
+    if failed is not None:
+        failed.extend(failed_paths)
+    return download_count, error_count, reused_count
+
+def store_package_blobs(package_dir, files):
+    """Add the files of a package tree to the blob store
+    
+    Args:
+        package_dir (str): Directory of the package
+        files (dict): Maps relative paths to blob SHAs
+    """
+    for rel_path, sha in files.items():
+        file_path = os.path.join(package_dir, *rel_path.split('/'))
+        if os.path.exists(file_path):
+            store_blob(file_path, sha)
+
+def get_blob_store_stats():
+    """Get (blob count, total size in bytes, blobs no package tree links to)"""
+    count = size = unused = 0
+    if os.path.exists(BLOBS_DIR):
+        for dir_path, _, file_names in os.walk(BLOBS_DIR):
+            for file_name in file_names:
+                if file_name.endswith(BLOB_RECORD_SUFFIX):
+                    continue
+                stat = os.stat(os.path.join(dir_path, file_name))
+                count += 1
+                size += stat.st_size
+                if stat.st_nlink == 1:
+                    unused += 1
+    return count, size, unused
+
+def show_blob_store():
+    """Show how much the blob store holds"""
+    count, size, unused = get_blob_store_stats()
+    print(f"\n{INFO_STYLE}Blob store: {count} blobs, {size / (1024 * 1024):.1f} MB, "
+          f"{unused} not used by an installed package{RESET_STYLE}")
+
+def prune_blob_store():
+    """Delete blobs that no package tree links to
+    
+    A blob whose only link is the store itself is unused. Where hardlinks
+    aren't supported every blob looks unused, so this frees everything that
+    would otherwise be reused on reinstall.
+    """
+    removed = 0
+    if os.path.exists(BLOBS_DIR):
+        for dir_path, _, file_names in os.walk(BLOBS_DIR):
+            for file_name in file_names:
+                blob_path = os.path.join(dir_path, file_name)
+                if file_name.endswith(BLOB_RECORD_SUFFIX):
+                    # Records of blobs removed by an earlier prune or verification
+                    if os.path.exists(blob_path) and not os.path.exists(blob_path[:-len(BLOB_RECORD_SUFFIX)]):
+                        os.remove(blob_path)
+                    continue
+                if os.stat(blob_path).st_nlink == 1:
+                    os.remove(blob_path)
+                    if os.path.exists(blob_path + BLOB_RECORD_SUFFIX):
+                        os.remove(blob_path + BLOB_RECORD_SUFFIX)
+                    removed += 1
+        remove_empty_dirs(BLOBS_DIR)
+    print(f"{SUCCESS_STYLE}Removed {removed} unused blobs.{RESET_STYLE}")
+    log_info(f"Pruned {removed} blobs from the blob store")
+
+def make_staging_dir(prefix):
+    """Create a uniquely named directory in STAGING_DIR
+    
+    Unlike tempfile.mkdtemp the directory gets the normal umask permissions,
+    which matters because staged package trees are renamed into PACKAGES_DIR.
+    """
+    while True:
+        staging_dir = os.path.join(STAGING_DIR, f"{prefix}-{uuid.uuid4().hex[:12]}")
+        try:
+            os.makedirs(staging_dir)
+            return staging_dir
+        except FileExistsError:
+            continue
+
+def create_staging_dir(package_name, clone_from=None):
+    """Create an empty staging directory for a package, optionally pre-filled with an existing tree
+    
+    Args:
+        package_name (str): Name of the package
+        clone_from (str, optional): Package directory whose files are hardlinked into the staging directory.
+            Its __pycache__ directories are left out, bytecode is rebuilt from the new tree.
+    
+    Returns:
+        str: Path of the staging directory
+    """
+    staging_dir = make_staging_dir(package_name)
+    if clone_from and os.path.isdir(clone_from):
+        for dir_path, dir_names, file_names in os.walk(clone_from):
+            dir_names[:] = [d for d in dir_names if d != "__pycache__"]
+            target_dir = os.path.join(staging_dir, os.path.relpath(dir_path, clone_from))
+            os.makedirs(target_dir, exist_ok=True)
+            for file_name in file_names:
+                link_or_copy(os.path.join(dir_path, file_name), os.path.join(target_dir, file_name))
+    return staging_dir
+
+def move_to_trash(path, label):
+    """Move a directory out of the way so it can be deleted in the background
+    
+    Returns:
+        str: New location of the directory
+    """
+    os.makedirs(TRASH_DIR, exist_ok=True)
+    trash_path = os.path.join(TRASH_DIR, f"{label}-{time.time_ns()}")
+    os.rename(path, trash_path)
+    return trash_path
+
+def reap_trash(background=True):
+    """Delete everything in TRASH_DIR, by default on a background thread"""
+    def reap():
+        with _reaper_lock:
+            if not os.path.exists(TRASH_DIR):
+                return
+            for entry in os.listdir(TRASH_DIR):
+                shutil.rmtree(os.path.join(TRASH_DIR, entry), ignore_errors=True)
+
+    if background:
+        threading.Thread(target=reap, name="ligma-reaper", daemon=True).start()
+    else:
+        reap()
+
+def get_version_dir(package_name, version_id=None):
+    """Get the directory holding the kept versions of a package, or one version of it"""
+    if version_id is None:
+        return os.path.join(VERSIONS_DIR, package_name)
+    return os.path.join(VERSIONS_DIR, package_name, version_id)
+
+def get_tree_version_id(package_name, package_dir):
+    """Identify a package tree by its version and a digest of its files
+    
+    Returns:
+        str: Version id like "1.2-3f9a2c1"; trees with the same content get the same id
+    """
+    manifest = load_package_manifest(package_name, package_dir)
+    files = manifest['files'] if manifest else scan_package_files(package_dir)
+    version = "0.0"
+    desc_file = os.path.join(package_dir, "description.txt")
+    if os.path.exists(desc_file):
+        with open(desc_file, 'r', encoding='utf-8') as f:
+            version = parse_description_file(f.read())['version']
+    digest = hashlib.sha1(json.dumps(sorted(files.items())).encode()).hexdigest()
+    return f"{version}-{digest[:7]}"
+
+def read_version_pointer(package_name):
+    """Get the version id of the active version of a package, or None if unknown"""
+    pointer_path = os.path.join(get_version_dir(package_name), CURRENT_VERSION_FILE)
+    try:
+        with open(pointer_path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def write_version_pointer(package_name, version_id):
+    """Atomically point a package at one of its versions"""
+    pointer_path = os.path.join(get_version_dir(package_name), CURRENT_VERSION_FILE)
+    os.makedirs(os.path.dirname(pointer_path), exist_ok=True)
+    with open(f"{pointer_path}.part", 'w', encoding='utf-8') as f:
+        f.write(version_id)
+    os.replace(f"{pointer_path}.part", pointer_path)
+
+def get_package_dir(package_name):
+    """Get the directory of the active version of a package
+    
+    While a version switch is renaming trees the package directory is briefly
+    missing; the version pointer then still names the tree that was active.
+    """
+    package_dir = os.path.join(PACKAGES_DIR, package_name)
+    if not os.path.exists(package_dir):
+        version_id = read_version_pointer(package_name)
+        if version_id and os.path.isdir(get_version_dir(package_name, version_id)):
+            return get_version_dir(package_name, version_id)
+    return package_dir
+
+def list_package_versions(package_name):
+    """List the kept previous versions of a package, most recently active first"""
+    versions_dir = get_version_dir(package_name)
+    if not os.path.isdir(versions_dir):
+        return []
+    current = read_version_pointer(package_name)
+    versions = [entry for entry in os.listdir(versions_dir)
+                if entry != current and os.path.isdir(os.path.join(versions_dir, entry))]
+    return sorted(versions, key=lambda v: os.path.getmtime(os.path.join(versions_dir, v)), reverse=True)
+
+def retire_package_dir(package_name, package_dir, incoming_id=None):
+    """Move the active tree of a package into its kept versions
+    
+    Args:
+        package_name (str): Name of the package
+        package_dir (str): The active tree
+        incoming_id (str, optional): Version id of the tree replacing it; a tree
+            identical to the incoming one isn't kept
+    
+    Returns:
+        str: Version id the tree is kept under, None if it was discarded
+    """
+    version_id = get_tree_version_id(package_name, package_dir)
+    version_dir = get_version_dir(package_name, version_id)
+    if version_id == incoming_id:
+        move_to_trash(package_dir, package_name)
+        return None
+    if os.path.exists(version_dir):
+        # Identical content is already kept, only mark it as most recent
+        move_to_trash(package_dir, package_name)
+    else:
+        os.makedirs(os.path.dirname(version_dir), exist_ok=True)
+        os.rename(package_dir, version_dir)
+    os.utime(version_dir)
+    return version_id
+
+def prune_package_versions(package_name, keep=None):
+    """Trash all but the most recent kept versions of a package"""
+    keep = VERSIONS_KEPT if keep is None else keep
+    for version_id in list_package_versions(package_name)[keep:]:
+        move_to_trash(get_version_dir(package_name, version_id), f"{package_name}-{version_id}")
+
+def activate_package_dir(package_name, staging_dir):
+    """Make a fully built staging directory the installed version of a package
+    
+    The new tree is moved into place with a rename, so the package is never
+    visible half-installed. An existing tree is kept as a previous version
+    for rollbacks; versions beyond VERSIONS_KEPT are deleted in the background.
+    
+    Returns:
+        bool: True if the package was activated
+    """
+    package_dir = os.path.join(PACKAGES_DIR, package_name)
+    try:
+        version_id = get_tree_version_id(package_name, staging_dir)
+        if os.path.exists(package_dir):
+            retire_package_dir(package_name, package_dir, version_id)
+        # A kept copy of the tree being installed would only duplicate it
+        if os.path.isdir(get_version_dir(package_name, version_id)):
+            move_to_trash(get_version_dir(package_name, version_id), f"{package_name}-{version_id}")
+        os.rename(staging_dir, package_dir)
+        write_version_pointer(package_name, version_id)
+        prune_package_versions(package_name)
+    except OSError as e:
+        invalidate_package_registry()
+        print(f"{ERROR_STYLE}Error activating {package_name}: {e}. Try closing any applications using it.{RESET_STYLE}")
+        log_error(f"Error moving staged {package_name} into place", exception=e)
+        return False
+    invalidate_package_registry()
+    reap_trash()
+    return True
+
+def switch_package_version(package_name, version_id):
+    """Make a kept version of a package the active one
+    
+    Both trees are only renamed, so switching needs neither the network nor
+    copying any files.
+    
+    Returns:
+        bool: True if the version was activated
+    """
+    version_dir = get_version_dir(package_name, version_id)
+    package_dir = os.path.join(PACKAGES_DIR, package_name)
+    try:
+        if os.path.exists(package_dir):
+            previous_id = retire_package_dir(package_name, package_dir, version_id)
+            if previous_id:
+                log_info(f"Kept {package_name} {previous_id}")
+        os.rename(version_dir, package_dir)
+        write_version_pointer(package_name, version_id)
+    except OSError as e:
+        invalidate_package_registry()
+        print(f"{ERROR_STYLE}Error switching {package_name} to {version_id}: {e}. Try closing any applications using it.{RESET_STYLE}")
+        log_error(f"Error switching {package_name} to {version_id}", exception=e)
+        return False
+    invalidate_package_registry()
+    reap_trash()
+
+    # Requirements of a version that was installed before are usually cached already
+    install_package_requirements(package_name)
+    print(f"{SUCCESS_STYLE}{package_name} is now at version {version_id}.{RESET_STYLE}")
+    log_info(f"Switched {package_name} to version {version_id}")
+    return True
+
+def rollback_package(package_name):
+    """Switch a package back to the version that was active before the current one"""
+    versions = list_package_versions(package_name)
+    if not versions:
+        print(f"{WARNING_STYLE}No previous version of {package_name} is kept.{RESET_STYLE}")
+        return False
+    return switch_package_version(package_name, versions[0])
+
+def use_package_version(package_name, version):
+    """Switch a package to a kept version
+    
+    Args:
+        package_name (str): Name of the package
+        version (str): A full version id or a version number; for a number the
+            most recently active matching version is used
+    """
+    versions = list_package_versions(package_name)
+    matches = [v for v in versions if v == version or v.rsplit('-', 1)[0] == version]
+    if not matches:
+        current = read_version_pointer(package_name)
+        if current and (current == version or current.rsplit('-', 1)[0] == version):
+            print(f"{INFO_STYLE}{package_name} is already at version {current}.{RESET_STYLE}")
+            return True
+        print(f"{ERROR_STYLE}Version {version} of {package_name} is not kept. Use 'ligma {package_name} ?versions' to list kept versions.{RESET_STYLE}")
+        return False
+    return switch_package_version(package_name, matches[0])
+
+def show_package_versions(package_name):
+    """List the active and kept versions of a package"""
+    current = read_version_pointer(package_name)
+    versions = list_package_versions(package_name)
+    if not current and not versions:
+        print(f"{WARNING_STYLE}No versions of {package_name} recorded.{RESET_STYLE}")
+        return
+    print(f"\n{INFO_STYLE}Versions of {package_name}:{RESET_STYLE}")
+    if current:
+        print(f"{SUCCESS_STYLE}  ▶ {current} (active){RESET_STYLE}")
+    for version_id in versions:
+        print(f"  ▶ {version_id}")
+
+def try_download_from_source(package_name, source, package_dir, workers=None, ref=DEFAULT_REF):
+    """Try to download a package from a specific source"""
+    try:
+        tree = get_source_tree(source, ref)
+        if tree is None:
+            return False, 0, 0
+
+        files = get_package_files(tree, package_name)
+        if not files:
+            return False, 0, 0
+
+        # Files already in the blob store are linked, the rest is fetched at once
+        failed = []
+        download_count, error_count, reused_count = fetch_package_files(
+            source, package_dir, files, list(files), workers, failed, ref
+        )
+        if reused_count:
+            log_info(f"Reused {reused_count} files of {package_name} from the blob store")
+
+        failed = set(failed)
+        write_package_manifest(package_name, package_dir, source, {
+            rel_path: entry['sha'] for rel_path, entry in files.items()
+            if os.path.join(package_dir, *rel_path.split('/')) not in failed
+        }, ref=ref, commit=get_source_commit(source, ref))
+        return True, download_count, error_count
+    except:
+        return False, 0, 0
+
+def remove_empty_dirs(root_dir):
+    """Remove empty subdirectories below root_dir, deepest first"""
+    for dir_path, _, _ in sorted(os.walk(root_dir), key=lambda item: -len(item[0])):
+        if dir_path != root_dir and not os.listdir(dir_path):
+            os.rmdir(dir_path)
+
+def try_update_from_source(package_name, source, package_dir, local_files, prune=True, workers=None, ref=DEFAULT_REF):
+    """Bring an installed package in line with a source by transferring only changed files
+    
+    Files whose blob SHA matches the source are left alone, new and changed
+    files are downloaded and files that disappeared upstream are deleted.
+    
+    Args:
+        package_name (str): Name of the package
+        source (str): The source repository in format username/repo
+        package_dir (str): Directory of the installed package
+        local_files (dict): Maps relative paths to the blob SHAs currently installed
+        prune (bool): Whether to delete files that no longer exist upstream
+        workers (int, optional): Number of parallel file downloads. Defaults to DOWNLOAD_WORKERS.
+        ref (str): Branch, tag or commit to update to
+    
+    Returns:
+        tuple: (success, download_count, error_count)
+    """
+    try:
+        tree = get_source_tree(source, ref)
+        if tree is None:
+            return False, 0, 0
+
+        files = get_package_files(tree, package_name)
+        if not files:
+            return False, 0, 0
+
+        changes = diff_package_files(local_files, files)
+        # Files that are recorded but were deleted locally have to be fetched again
+        missing = [rel_path for rel_path in files
+                   if rel_path not in changes['added'] and rel_path not in changes['changed']
+                   and not os.path.exists(os.path.join(package_dir, *rel_path.split('/')))]
+
+        fetched = changes['added'] + changes['changed'] + missing
+        failed = []
+        download_count, error_count, reused_count = fetch_package_files(
+            source, package_dir, files, fetched, workers, failed, ref
+        )
+
+        removed_count = 0
+        if prune:
+            for rel_path in changes['removed']:
+                file_path = os.path.join(package_dir, *rel_path.split('/'))
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    removed_count += 1
+            remove_empty_dirs(package_dir)
+
+        # Files that failed to download keep whatever version is still on disk
+        failed = set(failed)
+        recorded = {}
+        for rel_path, entry in files.items():
+            if os.path.join(package_dir, *rel_path.split('/')) not in failed:
+                recorded[rel_path] = entry['sha']
+            elif rel_path in local_files:
+                recorded[rel_path] = local_files[rel_path]
+        write_package_manifest(package_name, package_dir, source, recorded,
+                               ref=ref, commit=get_source_commit(source, ref))
+
+        unchanged_count = len(files) - len(fetched)
+        log_info(f"Delta update of {package_name} from {source}: {download_count} downloaded, "
+                 f"{reused_count} from blob store, {unchanged_count} unchanged, "
+                 f"{removed_count} removed, {error_count} errors")
+        return True, download_count, error_count
+    except Exception as e:
+        log_error(f"Error updating {package_name} from {source}", exception=e)
+        return False, 0, 0
+
+def is_requirement_satisfied(requirement):
+    """Check whether a requirement is met by an installed distribution
+    
+    Args:
+        requirement (str): Requirement specifier, e.g. "rich>=13"
+    
+    Returns:
+        bool: True if a matching distribution is installed
+    """
+    if importlib_metadata is None:
+        return False
+    try:
+        if Requirement is not None:
+            parsed = Requirement(requirement)
+            if parsed.marker is not None and not parsed.marker.evaluate():
+                return True
+            version = importlib_metadata.version(parsed.name)
+            return not parsed.specifier or parsed.specifier.contains(version, prereleases=True)
+        # Without packaging only the distribution name can be checked
+        name = re.split(r"[\s<>=!~;\[]", requirement, maxsplit=1)[0]
+        importlib_metadata.version(name)
+        return True
+    except Exception:
+        return False
+
+def load_requirements_cache():
+    """Load the cache of requirement sets that are known to be installed"""
+    try:
+        with open(REQUIREMENTS_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_requirements_cache(cache):
+    """Save the cache of requirement sets that are known to be installed"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(REQUIREMENTS_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+    except Exception as e:
+        log_error("Error saving requirements cache", exception=e)
+
+def has_wheelhouse():
+    """Check whether the local wheelhouse contains any wheels"""
+    return os.path.isdir(WHEELHOUSE_DIR) and any(name.endswith(".whl") for name in os.listdir(WHEELHOUSE_DIR))
+
+def run_pip(args, message):
+    """Run pip with a loading animation, returns True if it succeeded"""
+    with _pip_lock:
+        result = loading_animation(message, task=lambda: subprocess.run(
+            [sys.executable, "-m", "pip", *args], 
+            stdout=subprocess.DEVNULL, 
+            stderr=subprocess.DEVNULL
+        ))
+    return result is not None and result.returncode == 0
+
+def run_pip_install(requirements):
+    """Install several requirements with a single pip invocation
+    
+    If a wheelhouse exists the requirements are installed from it without
+    touching the network; only if that fails is PyPI consulted.
+    
+    Returns:
+        bool: True if pip succeeded
+    """
+    if has_wheelhouse():
+        if run_pip(["install", "--no-index", "--find-links", WHEELHOUSE_DIR, *requirements],
+                   f"Installing {', '.join(requirements)} from wheelhouse"):
+            return True
+        log_info(f"Wheelhouse doesn't cover {requirements}, falling back to PyPI")
+        return run_pip(["install", "--find-links", WHEELHOUSE_DIR, *requirements],
+                       f"Installing {', '.join(requirements)}")
+    return run_pip(["install", *requirements], f"Installing {', '.join(requirements)}")
+
+def collect_wheelhouse_requirements():
+    """Collect the requirements of all installed and catalogued packages
+    
+    Returns:
+        list: Sorted, de-duplicated requirement specifiers
+    """
+    requirements = set()
+    for pkg in get_installed_packages():
+        requirements.update(get_package_description(pkg, installed=True)['requirements'])
+    for source in get_ordered_sources():
+        catalog = get_catalog(source)
+        if catalog:
+            for info in catalog['packages'].values():
+                requirements.update(info.get('requirements', []))
+    return sorted(req for req in requirements if req.lower() not in CORE_LIBS)
+
+def build_wheelhouse():
+    """Download or build wheels for every known package requirement into the wheelhouse"""
+    requirements = collect_wheelhouse_requirements()
+    if not requirements:
+        print(f"{WARNING_STYLE}No package requirements found.{RESET_STYLE}")
+        return False
+
+    os.makedirs(WHEELHOUSE_DIR, exist_ok=True)
+    print(f"{INFO_STYLE}Building wheelhouse for {len(requirements)} requirement(s)...{RESET_STYLE}")
+    log_info(f"Building wheelhouse: {requirements}")
+
+    wheel_args = ["wheel", "--wheel-dir", WHEELHOUSE_DIR, "--find-links", WHEELHOUSE_DIR]
+    failed = []
+    if not run_pip([*wheel_args, *requirements], "Fetching wheels"):
+        # One bad requirement fails the whole batch, so find out which ones
+        for req in requirements:
+            if not run_pip([*wheel_args, req], f"Fetching {req}"):
+                failed.append(req)
+
+    wheel_count = len([name for name in os.listdir(WHEELHOUSE_DIR) if name.endswith(".whl")])
+    if failed:
+        print(f"{WARNING_STYLE}Wheelhouse built with {wheel_count} wheels. Could not fetch: {', '.join(failed)}{RESET_STYLE}")
+        log_warning(f"Wheelhouse incomplete, failed requirements: {failed}")
+    else:
+        print(f"{SUCCESS_STYLE}Wheelhouse built with {wheel_count} wheels.{RESET_STYLE}")
+        log_success(f"Wheelhouse built with {wheel_count} wheels")
+    return not failed
+
+def show_wheelhouse():
+    """List the wheels in the local wheelhouse"""
+    if not has_wheelhouse():
+        print(f"{WARNING_STYLE}The wheelhouse is empty. Use 'ligma wheelhouse build' to fill it.{RESET_STYLE}")
+        return
+    wheels = sorted(name for name in os.listdir(WHEELHOUSE_DIR) if name.endswith(".whl"))
+    total_size = sum(os.path.getsize(os.path.join(WHEELHOUSE_DIR, name)) for name in wheels)
+    print(f"\n{INFO_STYLE}Wheelhouse ({len(wheels)} wheels, {total_size / (1024 * 1024):.1f} MB):{RESET_STYLE}")
+    for name in wheels:
+        print(f"  ▶ {name}")
+
+def clear_wheelhouse():
+    """Delete all wheels from the local wheelhouse"""
+    if os.path.exists(WHEELHOUSE_DIR):
+        shutil.rmtree(WHEELHOUSE_DIR)
+    print(f"{SUCCESS_STYLE}Wheelhouse cleared.{RESET_STYLE}")
+    log_info("Wheelhouse cleared")
+
+def install_package_requirements(package_name):
+    """Install the pip requirements listed in a package's description.txt
+    
+    Requirements that are already satisfied by an installed distribution are
+    skipped and everything else is installed with one pip call. Once a
+    package version's requirements are satisfied this is remembered, so
+    reinstalls and updates of that version don't check again.
+    
+    Returns:
+        bool: True if all requirements are satisfied
+    """
+    # Concurrent installs take turns, pip and the requirements cache aren't thread-safe
+    report_install_progress("waiting for pip")
+    with _pip_lock:
+        report_install_progress("installing requirements")
+        return _install_package_requirements(package_name)
+
+def _install_package_requirements(package_name):
+    desc = get_package_description(package_name, installed=True)
+    requirements = [req for req in desc['requirements'] if req.lower() not in CORE_LIBS]
+    if not desc['requirements']:
+        return True
+
+    cache = load_requirements_cache()
+    cache_key = f"{package_name}@{desc['version']}"
+    cached = cache.get(cache_key)
+    if cached and cached.get('requirements') == requirements and cached.get('python') == sys.executable:
+        log_info(f"Requirements of {cache_key} already satisfied")
+        return True
+
+    print(f"\n{INFO_STYLE}Installing dependencies...{RESET_STYLE}")
+    log_info(f"Installing dependencies for {package_name}: {desc['requirements']}")
+    for req in desc['requirements']:
+        if req.lower() in CORE_LIBS:
+            print(f"{WARNING_STYLE}Skipping {req} (already included in SigmaOS).{RESET_STYLE}")
+            log_info(f"Skipping requirement {req} (core library)")
+
+    missing = [req for req in requirements if not is_requirement_satisfied(req)]
+    for req in requirements:
+        if req not in missing:
+            print(f"{SUCCESS_STYLE}Requirement {req} already satisfied.{RESET_STYLE}")
+
+    if missing:
+        try:
+            if not run_pip_install(missing):
+                print(f"{ERROR_STYLE}Error installing {', '.join(missing)}{RESET_STYLE}")
+                log_error(f"pip failed to install requirements of {package_name}: {missing}")
+                return False
+            log_info(f"Installed requirements {missing}")
+        except Exception as e:
+            print(f"{ERROR_STYLE}Error installing {', '.join(missing)}: {e}{RESET_STYLE}")
+            log_error(f"Error installing requirements {missing}", exception=e)
+            return False
+
+    cache[cache_key] = {'requirements': requirements, 'python': sys.executable}
+    save_requirements_cache(cache)
+    return True
+
+def get_archive_url(source, ref=DEFAULT_REF):
+    """Build the zip archive download URL for a source repository"""
+    _, _, archive_url, repository = get_source_endpoints(source)
+    return f"{archive_url}/{repository}/zip/{quote(ref)}"
+
+def download_source_archive(source, archive_path, ref=DEFAULT_REF):
+    """Download the zip archive of a source repository, streaming it to disk
+    
+    Args:
+        source (str): The source repository in format username/repo
+        archive_path (str): Local path the archive is written to
+        ref (str): Branch, tag or commit to download
+    
+    Returns:
+        bool: True if the archive was downloaded successfully
+    """
+    if not download_file(get_archive_url(source, ref), archive_path):
+        log_error(f"Failed to download archive of {source}")
+        return False
+    return True
+
+def extract_packages_from_archive(archive_path, package_names, target_dir, paths=None):
+    """Extract only the requested package directories from a repository archive
+    
+    Args:
+        archive_path (str): Path of the downloaded zip archive
+        package_names (list): Names of the packages to extract
+        target_dir (str): Directory the package directories are extracted into
+        paths (set, optional): Repository paths to extract; all files of the packages if not given
+    
+    Returns:
+        dict: Maps each extracted package name to the number of files written
+    """
+    wanted = set(package_names)
+    extracted = {}
+    target_root = os.path.realpath(target_dir)
+
+    with ZipFile(archive_path) as archive:
+        for member in archive.infolist():
+            # Archive entries look like "<repo>-<ref>/<package>/<path>"
+            parts = member.filename.split('/')
+            if len(parts) < 3 or parts[1] not in wanted or member.is_dir():
+                continue
+            if paths is not None and "/".join(parts[1:]) not in paths:
+                continue
+            file_path = os.path.realpath(os.path.join(target_dir, *parts[1:]))
+            if not file_path.startswith(target_root + os.sep):
+                log_warning(f"Skipping unsafe archive entry: {member.filename}")
+                continue
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with archive.open(member) as src, open(file_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            extracted[parts[1]] = extracted.get(parts[1], 0) + 1
+
+    return extracted
+
+def install_packages_from_archive(package_names, is_update=False, archives=None):
+    """Install several packages by downloading one archive per source
+    
+    Args:
+        package_names (list): Names of the packages to install
+        is_update (bool): Whether this is an update operation
+        archives (dict, optional): Archives downloaded earlier, by (source, ref).
+            Archives downloaded now are added to it and the caller deletes them,
+            so several calls share one download per source.
+    
+    Returns:
+        dict: Maps each package name to True if it was installed successfully
+    """
+    if not os.path.exists(PACKAGES_DIR):
+        os.makedirs(PACKAGES_DIR)
+        log_info(f"Created packages directory at {PACKAGES_DIR}")
+
+    results = {}
+    remaining = []
+    for pkg in package_names:
+        if os.path.exists(os.path.join(PACKAGES_DIR, pkg)) and not is_update:
+            print(f"{WARNING_STYLE}Package {pkg} already installed. Use 'ligma {pkg} ?update' to update.{RESET_STYLE}")
+            log_warning(f"Package {pkg} already downloaded.")
+            results[pkg] = False
+        elif pkg not in remaining:
+            remaining.append(pkg)
+
+    sources = get_ordered_sources()
+
+    for source in sources:
+        if not remaining:
+            break
+
+        # Only download archives of sources that actually contain a requested package
+        tree = get_source_tree(source)
+        if tree is None:
+            continue
+        # The archive has to hold the commit the tree and its blob SHAs were listed at
+        ref = get_source_commit(source) or DEFAULT_REF
+        top_level = {entry['path'] for entry in tree if entry['type'] == 'tree' and '/' not in entry['path']}
+        available = [pkg for pkg in remaining if pkg in top_level]
+        if not available:
+            continue
+
+        if is_local_source(source):
+            # A local source is read from disk anyway, there is no archive to save requests
+            for pkg, success in install_packages_parallel(available, is_update).items():
+                results[pkg] = success
+                remaining.remove(pkg)
+            continue
+
+        # Only files the blob store lacks are taken from the archive; packages
+        # that are fully stored are linked from it without any download
+        missing_paths = {
+            pkg: {entry['path'] for entry in get_package_files(tree, pkg).values()
+                  if not os.path.exists(get_blob_path(entry['sha']))}
+            for pkg in available
+        }
+        stored = [pkg for pkg in available if not missing_paths[pkg]]
+        if stored:
+            for pkg, success in install_packages_parallel(stored, is_update).items():
+                results[pkg] = success
+                remaining.remove(pkg)
+        available = [pkg for pkg in available if missing_paths[pkg]]
+        if not available:
+            continue
+
+        archive_path = archives.get((source, ref)) if archives is not None else None
+        if archive_path is None:
+            print(f"{INFO_STYLE}Downloading archive of {source}...{RESET_STYLE}")
+            archive_path = os.path.join(make_staging_dir("archive"), "source.zip")
+            if not download_source_archive(source, archive_path, ref):
+                print(f"{ERROR_STYLE}Could not download archive of {source}.{RESET_STYLE}")
+                shutil.rmtree(os.path.dirname(archive_path), ignore_errors=True)
+                continue
+            if archives is not None:
+                archives[(source, ref)] = archive_path
+
+        staging_dir = make_staging_dir("extract")
+        try:
+            extracted = extract_packages_from_archive(
+                archive_path, available, staging_dir, set().union(*missing_paths.values())
+            )
+
+            def finalize(pkg, staging_dir=staging_dir, source=source, tree=tree, ref=ref):
+                package_dir = os.path.join(PACKAGES_DIR, pkg)
+                staged_package_dir = os.path.join(staging_dir, pkg)
+                package_files = get_package_files(tree, pkg)
+                stored_paths = [rel_path for rel_path, entry in package_files.items()
+                                if entry['path'] not in missing_paths[pkg]]
+                _, _, reused_count = fetch_package_files(source, staged_package_dir, package_files, stored_paths, ref=ref)
+                manifest_files = {
+                    rel_path: entry['sha'] for rel_path, entry in package_files.items()
+                    if os.path.exists(os.path.join(staged_package_dir, *rel_path.split('/')))
+                }
+                write_package_manifest(pkg, staged_package_dir, source, manifest_files,
+                                       commit=ref if is_immutable_ref(ref) else None)
+                store_package_blobs(staged_package_dir, manifest_files)
 
-# Keep this for backward compatibility, redirects to the new browse_packages function
-def list_packages():
-    """Redirects to browse_packages for backward compatibility"""
-    browse_packages()
+                if (os.path.exists(package_dir) and not is_update) or not activate_package_dir(pkg, staged_package_dir):
+                    return False
 
-def try_download_from_source(package_name, source, package_dir, headers, is_update=False):
-    """Try to download a package from a specific source"""
-    package_url = f"https://api.github.com/repos/{source}/contents/{package_name}"
-    try:
-        response = requests.get(package_url, headers=headers)
-        if response.status_code != 200:
-            return False, 0, 0
+                if not os.path.exists(os.path.join(package_dir, "main.py")):
+                    print(f"{WARNING_STYLE}Warning: main.py not found in {pkg}. This package might not be runnable.{RESET_STYLE}")
+                install_package_requirements(pkg)
 
-        files_data = response.json()
-        download_count = 0
-        error_count = 0
-
-        for file_info in files_data:
-            if file_info['type'] == 'file':
-                file_name = file_info['name']
-                download_url = file_info['download_url']
-                try:
-                    file_response = requests.get(download_url)
-                    if file_response.status_code == 200:
-                        file_path = os.path.join(package_dir, file_name)
-                        with open(file_path, 'wb') as f:
-                            f.write(file_response.content)
-                        download_count += 1
-                    else:
-                        error_count += 1
-                except:
-                    error_count += 1
-            elif file_info['type'] == 'dir':
-                subdir_name = file_info['name']
-                subdir_path = os.path.join(package_dir, subdir_name)
-                os.makedirs(subdir_path, exist_ok=True)
-                subdir_url = file_info['url']
-                
-                try:
-                    subdir_response = requests.get(subdir_url, headers=headers)
-                    if subdir_response.status_code == 200:
-                        subdir_files = subdir_response.json()
-                        for subfile in subdir_files:
-                            if subfile['type'] == 'file':
-                                subfile_name = subfile['name']
-                                subfile_download_url = subfile['download_url']
-                                try:
-                                    subfile_response = requests.get(subfile_download_url)
-                                    if subfile_response.status_code == 200:
-                                        subfile_path = os.path.join(subdir_path, subfile_name)
-                                        with open(subfile_path, 'wb') as f:
-                                            f.write(subfile_response.content)
-                                        download_count += 1
-                                    else:
-                                        error_count += 1
-                                except:
-                                    error_count += 1
-                except:
-                    pass
+                print(f"{SUCCESS_STYLE}Package {pkg} successfully {'updated' if is_update else 'installed'} from {source}.{RESET_STYLE}")
+                log_info(f"Package {pkg} successfully {'updated' if is_update else 'installed'} from archive. Extracted {extracted[pkg]} files, reused {reused_count} from the blob store.")
+                return True
 
-        return True, download_count, error_count
-    except:
-        return False, 0, 0
+            # Activation and requirements of the extracted packages run concurrently
+            finalized = run_install_jobs({
+                pkg: (lambda pkg=pkg: finalize(pkg)) for pkg in available if pkg in extracted
+            })
+            for pkg, success in finalized.items():
+                results[pkg] = success
+                remaining.remove(pkg)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            if archives is None:
+                shutil.rmtree(os.path.dirname(archive_path), ignore_errors=True)
+
+    for pkg in remaining:
+        print(f"{ERROR_STYLE}Package {pkg} not found in any configured source.{RESET_STYLE}")
+        log_error(f"Package {pkg} not found in any source")
+        results[pkg] = False
 
-def download_package(package_name, is_update=False):
+    return results
+
+def download_package(package_name, is_update=False, workers=None):
     """
     Download and install a package from any configured source
     
     Args:
-        package_name (str): Name of the package to download
+        package_name (str): Name of the package to download, optionally pinned
+            to a tag or commit as 'name@ref'
         is_update (bool): Whether this is an update operation
+        workers (int, optional): Number of parallel file downloads. Defaults to DOWNLOAD_WORKERS.
     """
     if not os.path.exists(PACKAGES_DIR):
         os.makedirs(PACKAGES_DIR)
         log_info(f"Created packages directory at {PACKAGES_DIR}")
 
+    package_name, ref = split_package_spec(package_name)
     package_dir = os.path.join(PACKAGES_DIR, package_name)
 
     if os.path.exists(package_dir) and not is_update:
-        print(f"{WARNING_STYLE}Package {package_name} already installed. Use 'ligma {package_name} ?update' to update.{RESET_STYLE}")
-        log_warning(f"Package {package_name} already downloaded.")
-        return False
-
-    # Delete the package directory if this is an update
-    if is_update and os.path.exists(package_dir):
-        try:
-            shutil.rmtree(package_dir)
-            log_info(f"Removed existing package directory for update: {package_dir}")
-        except Exception as e:
-            print(f"{ERROR_STYLE}Error removing existing package for update: {e}{RESET_STYLE}")
-            log_error(f"Error removing package directory for update", exception=e)
+        if ref is None:
+            print(f"{WARNING_STYLE}Package {package_name} already installed. Use 'ligma {package_name} ?update' to update.{RESET_STYLE}")
+            log_warning(f"Package {package_name} already downloaded.")
             return False
+        # Installing an explicit ref over an installed package switches it to that ref
+        print(f"{INFO_STYLE}Switching {package_name} to {ref}...{RESET_STYLE}")
+        is_update = True
+    if ref is None:
+        # Updates stay on the ref the package was installed from
+        manifest = load_package_manifest(package_name) if is_update else None
+        ref = manifest.get('ref', DEFAULT_REF) if manifest else DEFAULT_REF
 
-    # Try sources in order: official first, then additional sources
-    sources = load_sources()
-    if OFFICIAL_REPO in sources:
-        sources.remove(OFFICIAL_REPO)
-        sources.insert(0, OFFICIAL_REPO)  # Ensure official repo is first
+    # Updates only transfer the files that changed since the last install
+    local_files = None
+    prune = False
+    sources = get_ordered_sources()
+    if is_update and os.path.exists(package_dir):
+        installed_source, local_files = get_local_package_files(package_name)
+        # Without a manifest we can't tell package files from files the package created itself
+        prune = installed_source is not None
+        if installed_source in sources:
+            sources = [installed_source]
 
-    headers = {'Accept': 'application/vnd.github.v3+json'}
-    os.makedirs(package_dir, exist_ok=True)
+    report_install_progress("resolving")
+    if SOURCE_RACING and len(sources) > 1:
+        # Ask all sources at once and only try the one that has the package
+        print(f"{INFO_STYLE}Resolving {package_name} across {len(sources)} sources...{RESET_STYLE}")
+        source, _ = resolve_package_source(package_name, sources, ref)
+        sources = [source] if source else []
+    else:
+        sources = [src for group in plan_source_lookup(package_name, sources, ref) for src in group]
 
-    for source in sources:
-        print(f"{INFO_STYLE}Trying source: {source}...{RESET_STYLE}")
-        success, download_count, error_count = try_download_from_source(
-            package_name, source, package_dir, headers, is_update
-        )
-        
-        if success:
-            # Verify the package has the necessary files
-            if not os.path.exists(os.path.join(package_dir, "main.py")):
-                print(f"{WARNING_STYLE}Warning: main.py not found in package. This package might not be runnable.{RESET_STYLE}")
-            
-            # Install package requirements
-            desc = get_package_description(package_name, installed=True)
-            if desc['requirements']:
-                print(f"\n{INFO_STYLE}Installing dependencies...{RESET_STYLE}")
-                log_info(f"Installing dependencies for {package_name}: {desc['requirements']}")
-                core_libs = {"colorama", "requests", "datetime", "json"}
-                for req in desc['requirements']:
-                    if req.lower() in core_libs:
-                        print(f"{WARNING_STYLE}Skipping {req} (already included in SigmaOS).{RESET_STYLE}")
-                        log_info(f"Skipping requirement {req} (core library)")
-                    else:
-                        try:
-                            loading_animation(f"Installing {req}", task=lambda req=req: subprocess.run(
-                                [sys.executable, "-m", "pip", "install", req], 
-                                stdout=subprocess.DEVNULL, 
-                                stderr=subprocess.DEVNULL
-                            ))
-                            log_info(f"Installed requirement {req}")
-                        except Exception as e:
-                            print(f"{ERROR_STYLE}Error installing {req}: {e}{RESET_STYLE}")
-                            log_error(f"Error installing requirement {req}", exception=e)
-            
-            # Report results
-            if error_count == 0:
-                print(f"{SUCCESS_STYLE}Package {package_name} successfully {'updated' if is_update else 'installed'} from {source}.{RESET_STYLE}")
-                log_info(f"Package {package_name} successfully {'updated' if is_update else 'installed'}. Downloaded {download_count} files.")
-                return True
+    # Build the new tree next to the installed one; unchanged files of an
+    # update are hardlinked from the current tree
+    staging_dir = create_staging_dir(package_name, clone_from=package_dir if local_files is not None else None)
+    try:
+        for source in sources:
+            print(f"{INFO_STYLE}Trying source: {source}...{RESET_STYLE}")
+            report_install_progress("downloading")
+            if local_files is not None:
+                success, download_count, error_count = try_update_from_source(
+                    package_name, source, staging_dir, local_files, prune, workers, resolve_ref(source, ref)
+                )
             else:
-                print(f"{WARNING_STYLE}Package {package_name} {'updated' if is_update else 'installed'} from {source} with {error_count} errors. Some functionality may be limited.{RESET_STYLE}")
-                log_warning(f"Package {package_name} {'updated' if is_update else 'installed'} with {error_count} errors.")
-                return True
+                success, download_count, error_count = try_download_from_source(
+                    package_name, source, staging_dir, workers, resolve_ref(source, ref)
+                )
+            
+            if success:
+                if not activate_package_dir(package_name, staging_dir):
+                    return False
+                staging_dir = None
+                record_package_source(package_name, source, ref)
+                
+                # Verify the package has the necessary files
+                if not os.path.exists(os.path.join(package_dir, "main.py")):
+                    print(f"{WARNING_STYLE}Warning: main.py not found in package. This package might not be runnable.{RESET_STYLE}")
+                
+                # Install package requirements
+                install_package_requirements(package_name)
+                
+                # Report results
+                if error_count == 0:
+                    print(f"{SUCCESS_STYLE}Package {package_name} successfully {'updated' if is_update else 'installed'} from {source}.{RESET_STYLE}")
+                    log_info(f"Package {package_name} successfully {'updated' if is_update else 'installed'}. Downloaded {download_count} files.")
+                    return True
+                else:
+                    print(f"{WARNING_STYLE}Package {package_name} {'updated' if is_update else 'installed'} from {source} with {error_count} errors. Some functionality may be limited.{RESET_STYLE}")
+                    log_warning(f"Package {package_name} {'updated' if is_update else 'installed'} with {error_count} errors.")
+                    return True
+    finally:
+        if staging_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
 
     # If we get here, no source had the package
+    if ref != DEFAULT_REF:
+        print(f"{ERROR_STYLE}Package {package_name}@{ref} not found in any configured source.{RESET_STYLE}")
+        log_error(f"Package {package_name}@{ref} not found in any source")
+        return False
     print(f"{ERROR_STYLE}Package {package_name} not found in any configured source.{RESET_STYLE}")
     log_error(f"Package {package_name} not found in any source")
     return False
@@ -697,7 +3180,12 @@ def uninstall_package(package_name):
     try:
         print(f"{WARNING_STYLE}Uninstalling {package_name}...{RESET_STYLE}")
         log_info(f"Uninstalling package {package_name}")
-        loading_animation(f"Removed {package_name}", task=lambda: shutil.rmtree(package_dir))
+        # Renaming is instant; the tree itself is deleted in the background
+        loading_animation(f"Removed {package_name}", task=lambda: move_to_trash(package_dir, package_name))
+        invalidate_package_registry()
+        if os.path.exists(get_version_dir(package_name)):
+            move_to_trash(get_version_dir(package_name), f"{package_name}-versions")
+        reap_trash()
         # Don't show redundant success message
         log_info(f"Package {package_name} successfully uninstalled.")
         return True
@@ -710,6 +3198,371 @@ def uninstall_package(package_name):
         log_error(f"Error uninstalling {package_name}", exception=e)
         return False
 
+class _ThreadOutput:
+    """Stand-in for sys.stdout that holds back what install workers print
+
+    Output of threads that called capture() is buffered until release(), so
+    the messages of concurrent installs don't interleave. Everything else is
+    written through to the real stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+
+    def capture(self):
+        self.buffers[threading.get_ident()] = []
+
+    def release(self):
+        return "".join(self.buffers.pop(threading.get_ident(), []))
+
+    def write(self, text):
+        buffer = self.buffers.get(threading.get_ident())
+        if buffer is None:
+            return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class InstallProgress:
+    """Single status line summarising the state of concurrently installed packages"""
+
+    def __init__(self, package_names, stream=None):
+        self.states = {pkg: "queued" for pkg in package_names}
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+        self.last_render = 0
+
+    def update(self, package_name, state, force=False):
+        with self.lock:
+            self.states[package_name] = state
+            # Per-file updates arrive quickly, redraw at most ten times a second
+            now = time.time()
+            if force or now - self.last_render >= 0.1:
+                self.last_render = now
+                self._render()
+
+    def emit(self, text):
+        """Print a finished package's output above the status line"""
+        with self.lock:
+            self.stream.write("\r\033[K" + text)
+            self._render()
+
+    def finish(self):
+        with self.lock:
+            self.stream.write("\r\033[K")
+            self.stream.flush()
+
+    def _render(self):
+        finished = sum(1 for state in self.states.values() if state in ("done", "failed"))
+        active = [f"{pkg}: {state}" for pkg, state in self.states.items()
+                  if state not in ("queued", "done", "failed")]
+        line = f"[{finished}/{len(self.states)}] " + ", ".join(active)
+        width = shutil.get_terminal_size((80, 20)).columns - 1
+        if len(line) > width:
+            line = line[:width - 3] + "..."
+        self.stream.write(f"\r\033[K{INFO_STYLE}{line}{RESET_STYLE}")
+        self.stream.flush()
+
+def report_install_progress(state):
+    """Report the state of the package the current thread is installing, if any"""
+    progress = getattr(_install_context, 'progress', None)
+    if progress is not None:
+        progress.update(_install_context.package, state)
+
+def run_install_jobs(jobs, max_parallel=None):
+    """Run per-package install jobs concurrently with aggregated progress
+    
+    Each job runs on its own worker; what it prints is buffered and shown as
+    one block once the package is finished. File downloads of all jobs share
+    the MAX_CONNECTIONS budget and pip runs one at a time.
+    
+    Args:
+        jobs (dict): Package name -> callable returning True on success
+        max_parallel (int, optional): Packages installed at once. Defaults to MAX_PARALLEL_INSTALLS.
+    
+    Returns:
+        dict: Package name -> bool
+    """
+    if not jobs:
+        return {}
+
+    output = _ThreadOutput(sys.stdout)
+    progress = InstallProgress(jobs, stream=output.stream)
+    workers = max(1, min(max_parallel or MAX_PARALLEL_INSTALLS, len(jobs)))
+
+    def run_job(package_name, job):
+        output.capture()
+        _install_context.package = package_name
+        _install_context.progress = progress
+        try:
+            success = bool(job())
+        except Exception as e:
+            print(f"{ERROR_STYLE}Error installing {package_name}: {e}{RESET_STYLE}")
+            log_error(f"Error installing {package_name}", exception=e)
+            success = False
+        finally:
+            _install_context.progress = None
+        progress.update(package_name, "done" if success else "failed", force=True)
+        return success, output.release()
+
+    results = {}
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_job, pkg, job): pkg for pkg, job in jobs.items()}
+            for future in as_completed(futures):
+                results[futures[future]], text = future.result()
+                progress.emit(f"{INFO_STYLE}[{futures[future]}]{RESET_STYLE}\n{text}")
+    finally:
+        sys.stdout = output.stream
+        progress.finish()
+    return results
+
+def install_packages_parallel(package_names, is_update=False, max_parallel=None):
+    """Install or update several packages concurrently
+    
+    Args:
+        package_names (list): Packages to install
+        is_update (bool): Whether this is an update operation
+        max_parallel (int, optional): Packages installed at once. Defaults to MAX_PARALLEL_INSTALLS.
+    
+    Returns:
+        dict: Package name -> bool
+    """
+    jobs = {pkg: (lambda pkg=pkg: download_package(pkg, is_update=is_update)) for pkg in package_names}
+    return run_install_jobs(jobs, max_parallel)
+
+def count_missing_blobs(files):
+    """Count the files of a package tree whose blob isn't in the blob store yet"""
+    return sum(1 for entry in files.values() if not os.path.exists(get_blob_path(entry['sha'])))
+
+def plan_package_batch(package_names):
+    """Group packages by the source they would be installed from
+    
+    Returns:
+        tuple: (plan, unresolved) where plan maps each source to {package:
+            number of its files missing from the blob store} and unresolved
+            lists the packages no source has
+    """
+    plan = {}
+    unresolved = list(package_names)
+    for source in get_ordered_sources():
+        if not unresolved:
+            break
+        tree = get_source_tree(source)
+        if tree is None:
+            continue
+        for pkg in list(unresolved):
+            files = get_package_files(tree, pkg)
+            if files:
+                plan.setdefault(source, {})[pkg] = count_missing_blobs(files)
+                unresolved.remove(pkg)
+    return plan, unresolved
+
+def install_package_batch(package_names, is_update=False, archives=None):
+    """Install or update several packages the fastest available way
+    
+    A source whose requested packages miss at least ARCHIVE_MIN_FILES blobs
+    is installed from one repository archive. Everything else goes through
+    the parallel scheduler, which fetches only the missing files.
+    
+    Args:
+        package_names (list): Packages to install, optionally pinned as 'name@ref'
+        is_update (bool): Whether this is an update operation
+        archives (dict, optional): Source archives shared between batches, see install_packages_from_archive
+    
+    Returns:
+        dict: Package name -> bool
+    """
+    if len(package_names) == 1:
+        return {package_names[0]: download_package(package_names[0], is_update=is_update)}
+    # Archives only cover the default branch, pinned packages are fetched file by file
+    if any('@' in pkg for pkg in package_names):
+        return install_packages_parallel(package_names, is_update)
+
+    plan, _ = plan_package_batch(package_names)
+    archive_packages = []
+    for source, missing in plan.items():
+        # Local sources are read from disk, an archive wouldn't save anything
+        if not is_local_source(source) and sum(missing.values()) >= ARCHIVE_MIN_FILES:
+            archive_packages.extend(missing)
+    log_debug(f"Batch of {len(package_names)} packages: {len(archive_packages)} from archives")
+
+    results = {}
+    if archive_packages:
+        results.update(install_packages_from_archive(archive_packages, is_update, archives))
+    # Packages no source has fail in download_package with the usual message
+    rest = [pkg for pkg in package_names if pkg not in archive_packages]
+    if rest:
+        results.update(install_packages_parallel(rest, is_update))
+    return results
+
+def get_package_dependencies(package_name, ref=None):
+    """Get the SigmaOS packages a package depends on
+    
+    Installed packages are read from their description.txt. For all others
+    only the package's own description is fetched from the source providing
+    it, at the requested ref, and kept in that source's catalog.
+    
+    Args:
+        package_name (str): Name of the package
+        ref (str, optional): Tag or commit the package is going to be installed from
+    
+    Returns:
+        list: Names of the dependencies, or None if the package can't be found
+    """
+    if ref is None:
+        if is_package_installed(package_name):
+            return get_package_description(package_name, installed=True)['dependencies']
+        ref = DEFAULT_REF
+    source, _ = resolve_package_source(package_name, ref=ref)
+    if source is None:
+        return None
+    ref = resolve_ref(source, ref)
+    with _get_catalog_lock(source, ref):
+        catalog = load_catalog(source, ref)
+        info = catalog['packages'].get(package_name, {}) if catalog else {}
+        if 'dependencies' not in info and info.get('desc_sha'):
+            parsed = fetch_package_descriptions(source, {package_name: f"{package_name}/description.txt"}, ref)
+            if package_name in parsed:
+                info.update(parsed[package_name])
+                save_catalog(catalog)
+    return info.get('dependencies', [])
+
+def build_dependency_graph(package_names):
+    """Collect the packages the given packages depend on, directly or indirectly
+    
+    Args:
+        package_names (list): Packages to start from, optionally as 'name@ref'
+    
+    Returns:
+        tuple: (graph, unknown) where graph maps each package of the closure to
+            its dependencies and unknown maps dependencies that couldn't be
+            found to a package requiring them
+    """
+    graph = {}
+    unknown = {}
+    refs = dict(split_package_spec(spec) for spec in package_names)
+    queue = list(refs)
+    while queue:
+        pkg = queue.pop(0)
+        if pkg in graph:
+            continue
+        dependencies = get_package_dependencies(pkg, refs.get(pkg))
+        # Requested packages that don't exist fail in the install with the usual message
+        graph[pkg] = dependencies or []
+        for dep in graph[pkg]:
+            if dep in graph or dep in unknown:
+                continue
+            if is_package_installed(dep) or resolve_package_source(dep)[0] is not None:
+                queue.append(dep)
+            else:
+                unknown[dep] = pkg
+    return graph, unknown
+
+def order_dependency_waves(graph):
+    """Split a dependency graph into waves of packages that can be installed together
+    
+    Every package only depends on packages of earlier waves.
+    
+    Returns:
+        tuple: (waves, cycle) where cycle is a list like [a, b, a] if the graph
+            has one, in which case waves only covers the packages before it
+    """
+    remaining = {pkg: {dep for dep in deps if dep in graph} for pkg, deps in graph.items()}
+    waves = []
+    while remaining:
+        wave = sorted(pkg for pkg, deps in remaining.items() if not deps)
+        if not wave:
+            # Every remaining package waits on another one, follow the chain until it repeats
+            path = [min(remaining)]
+            while path.count(path[-1]) < 2:
+                path.append(min(remaining[path[-1]]))
+            return waves, path[path.index(path[-1]):]
+        waves.append(wave)
+        for pkg in wave:
+            del remaining[pkg]
+        for deps in remaining.values():
+            deps.difference_update(wave)
+    return waves, None
+
+def install_packages(package_names, is_update=False):
+    """Install several packages together with the packages they depend on
+    
+    The dependency graph is installed in topological waves: all packages of
+    a wave are independent of each other and are installed concurrently once
+    everything they depend on is in place. Updates don't resolve dependencies.
+    
+    Args:
+        package_names (list): Packages to install, optionally pinned as 'name@ref'
+        is_update (bool): Whether this is an update operation
+    
+    Returns:
+        dict: Package name (without ref) -> bool for every package that was attempted
+    """
+    if is_update:
+        return install_package_batch(package_names, is_update=True)
+
+    specs = {split_package_spec(spec)[0]: spec for spec in package_names}
+    package_names = list(specs)
+    graph, unknown = build_dependency_graph(list(specs.values()))
+    for dep, required_by in unknown.items():
+        print(f"{ERROR_STYLE}Package {dep} (required by {required_by}) not found in any configured source.{RESET_STYLE}")
+        log_error(f"Dependency {dep} of {required_by} not found in any source")
+
+    waves, cycle = order_dependency_waves(graph)
+    if cycle:
+        print(f"{ERROR_STYLE}Dependency cycle detected: {' -> '.join(cycle)}{RESET_STYLE}")
+        log_error(f"Dependency cycle detected: {' -> '.join(cycle)}")
+        return {pkg: False for pkg in package_names}
+
+    extra = [pkg for pkg in graph if pkg not in package_names and not is_package_installed(pkg)]
+    if extra:
+        print(f"{INFO_STYLE}Also installing dependencies: {', '.join(extra)}{RESET_STYLE}")
+        log_info(f"Resolved dependencies: {', '.join(extra)}")
+
+    results = {}
+    missing = set(unknown)
+    # Every wave extracts from the same source archives, each is downloaded once
+    archives = {}
+    try:
+        for wave in waves:
+            pending = []
+            for pkg in wave:
+                failed_deps = [dep for dep in graph[pkg] if dep in missing]
+                if failed_deps:
+                    print(f"{ERROR_STYLE}Skipping {pkg}, missing dependencies: {', '.join(failed_deps)}{RESET_STYLE}")
+                    log_error(f"Skipping {pkg}, missing dependencies: {failed_deps}")
+                    results[pkg] = False
+                    missing.add(pkg)
+                elif pkg in package_names or not is_package_installed(pkg):
+                    pending.append(pkg)
+
+            if pending:
+                batch = install_package_batch([specs.get(pkg, pkg) for pkg in pending], archives=archives)
+                results.update({split_package_spec(spec)[0]: success for spec, success in batch.items()})
+            # Dependents only need the package to be there, not to be freshly installed
+            missing.update(pkg for pkg in pending if not is_package_installed(pkg))
+    finally:
+        for archive_path in archives.values():
+            shutil.rmtree(os.path.dirname(archive_path), ignore_errors=True)
+
+    return results
+
+def install_package(package_name):
+    """Install a package and the packages it depends on
+    
+    Returns:
+        bool: True if the package was installed successfully
+    """
+    return install_packages([package_name]).get(split_package_spec(package_name)[0], False)
+
 def install_multiple_packages(package_names):
     """Install multiple packages at once
     
@@ -726,9 +3579,9 @@ def install_multiple_packages(package_names):
     installed_count = 0
     failed_packages = []
     
+    results = install_packages(package_names)
     for pkg in package_names:
-        print(f"\n{INFO_STYLE}Installing {pkg} ({installed_count + 1}/{len(package_names)})...{RESET_STYLE}")
-        if download_package(pkg):
+        if results.get(split_package_spec(pkg)[0]):
             installed_count += 1
         else:
             failed_packages.append(pkg)
@@ -744,33 +3597,15 @@ def install_multiple_packages(package_names):
             log_warning(f"Partial installation. Failed packages: {', '.join(failed_packages)}")
 
 def run_package(package_name):
-    """
-    Execute a package by its name
-    
-    NOTE: This function is maintained for compatibility.
-    The primary implementation is in SigmaOS.py.
-    """
-    # Parse the package path with dot notation
-    parts = package_name.split('.')
-    base_package = parts[0]
-    
-    # Handle different path formats
-    if len(parts) == 1:
-        # Default case: just the package name, run main.py
-        file_path = os.path.join(PACKAGES_DIR, base_package, "main.py")
-    else:
-        # Nested case: handle arbitrary depth
-        if len(parts) == 2:
-            # Legacy format: package.file runs package/file.py
-            file_path = os.path.join(PACKAGES_DIR, parts[0], f"{parts[1]}.py")
-        else:
-            # New format: package.dir1.dir2.file runs package/dir1/dir2/file.py
-            # Last part is the file name, all others are directory components
-            file_name = parts[-1]
-            path_components = parts[:-1]
-            file_path = os.path.join(PACKAGES_DIR, *path_components, f"{file_name}.py")
-
-    if not os.path.exists(file_path):
+    """Execute a package by its name, e.g. 'pkg', 'pkg.file' or 'pkg.dir1.dir2.file'"""
+    file_path = get_package_entry_point(package_name)
+    if file_path is not None and not os.path.exists(file_path):
+        # The script was removed from the package since it was scanned
+        refresh_package_entry_points(package_name.split('.')[0], package_name)
+        file_path = get_package_entry_point(package_name)
+    if file_path is None or not os.path.exists(file_path):
+        parts = package_name.split('.')
+        file_path = os.path.join(get_package_dir(parts[0]), *parts[1:-1], f"{parts[-1] if len(parts) > 1 else 'main'}.py")
         print(f"{ERROR_STYLE}File not found: {file_path}{RESET_STYLE}")
         log_error(f"File not found: {file_path}")
         return False
@@ -822,51 +3657,19 @@ def run_package(package_name):
         return False
 
 def is_valid_package(package_name):
-    """
-    Check if a package exists and can be executed
+    """Check if a package exists and can be executed
     
-    NOTE: This function is maintained for compatibility.
-    The primary implementation is in SigmaOS.py.
+    Answered from the package registry, so SigmaOS can check every command
+    it dispatches without touching the filesystem.
     """
-    # Parse the package path with dot notation
-    parts = package_name.split('.')
-    base_package = parts[0]
-    
-    # Check if the base package directory exists
-    base_package_dir = os.path.join(PACKAGES_DIR, base_package)
-    if not os.path.exists(base_package_dir):
-        return False
-    
-    # Handle different path formats
-    if len(parts) == 1:
-        # Just the package name, check if main.py exists
-        return os.path.exists(os.path.join(base_package_dir, "main.py"))
-    elif len(parts) == 2:
-        # package.file format, check if file.py exists
-        return os.path.exists(os.path.join(base_package_dir, f"{parts[1]}.py"))
-    else:
-        # Nested format: check if the nested file exists
-        file_name = parts[-1]
-        path_components = parts[:-1]
-        return os.path.exists(os.path.join(PACKAGES_DIR, *path_components, f"{file_name}.py")) 
+    return get_package_entry_point(package_name) is not None
 
 def check_all_updates():
     """Check for updates for all installed packages"""
     # Define style variables at the beginning to avoid NameError
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import command_sth, description_sth
-    except ImportError:
-        # Fallback styles
-        command_sth = SUCCESS_STYLE
-        description_sth = RESET_STYLE
+    command_sth, description_sth = get_styles('command_sth', 'description_sth')
         
-    installed_packages = []
-    if os.path.exists(PACKAGES_DIR):
-        installed_packages = [d for d in os.listdir(PACKAGES_DIR) 
-                            if os.path.isdir(os.path.join(PACKAGES_DIR, d)) 
-                            and not d.startswith('.') 
-                            and d != "SigmaOS-packages-main"]
+    installed_packages = get_installed_packages()
 
     if not installed_packages:
         print(f"{WARNING_STYLE}No packages installed.{RESET_STYLE}")
@@ -875,26 +3678,33 @@ def check_all_updates():
     print(f"{INFO_STYLE}Checking for updates for {len(installed_packages)} packages...{RESET_STYLE}")
     
     updates_available = []
-    error_packages = []
+    
+    # Compare recorded blob SHAs with one tree listing per source
+    outdated, error_packages = find_package_updates(installed_packages)
+    for pkg in error_packages:
+        print(f"{ERROR_STYLE}Error checking update for {pkg}: Package not found in any configured source{RESET_STYLE}")
     
     for pkg in installed_packages:
-        try:
-            local_version = get_package_description(pkg, installed=True)['version']
-            online_content = get_github_file_content(pkg, "description.txt")
-            
-            if online_content:
-                online_desc = parse_description_file(online_content)
-                online_version = online_desc['version']
-                
-                if local_version != online_version:
-                    updates_available.append((pkg, local_version, online_version))
-                    print(f"{WARNING_STYLE}Update available for {pkg}: {local_version} → {online_version}{RESET_STYLE}")
+        if pkg not in outdated:
+            continue
+        source, changes, remote_files = outdated[pkg]
+        local_version = get_package_description(pkg, installed=True)['version']
+        online_version = local_version
+        
+        # Only look up the new version if description.txt itself changed
+        desc_entry = remote_files.get("description.txt")
+        if desc_entry and "description.txt" in changes['added'] + changes['changed']:
+            catalog = load_catalog(source)
+            entry = catalog['packages'].get(pkg, {}) if catalog else {}
+            if entry.get('desc_sha') == desc_entry['sha'] and 'version' in entry:
+                online_version = entry['version']
             else:
-                error_packages.append(pkg)
-                print(f"{ERROR_STYLE}Error checking update for {pkg}: Could not fetch online description{RESET_STYLE}")
-        except Exception as e:
-            error_packages.append(pkg)
-            print(f"{ERROR_STYLE}Error checking update for {pkg}: {e}{RESET_STYLE}")
+                online_version = fetch_package_descriptions(source, {pkg: desc_entry['path']}).get(pkg, {}).get('version', '?')
+        
+        updates_available.append((pkg, local_version, online_version))
+        changed_count = sum(len(paths) for paths in changes.values())
+        print(f"{WARNING_STYLE}Update available for {pkg}: {local_version} → {online_version} ({changed_count} file(s) changed){RESET_STYLE}")
+        print_package_changes(changes)
     
     if not updates_available:
         print(f"{SUCCESS_STYLE}All packages are up to date!{RESET_STYLE}")
@@ -943,9 +3753,10 @@ def check_all_updates():
     updated_count = 0
     failed_updates = []
     
+    # Delta updates transfer little, so they go through the scheduler rather than archives
+    results = install_packages_parallel(packages_to_update, is_update=True)
     for pkg in packages_to_update:
-        print(f"\n{INFO_STYLE}Updating {pkg}...{RESET_STYLE}")
-        if download_package(pkg, is_update=True):
+        if results.get(pkg):
             updated_count += 1
         else:
             failed_updates.append(pkg)
@@ -967,18 +3778,24 @@ def update_package(package_name):
     if not is_valid_package(package_name):
         print(f"{ERROR_STYLE}Package {package_name} is not installed.{RESET_STYLE}")
         return False
+
+    manifest = load_package_manifest(package_name)
+    if manifest and is_immutable_ref(manifest.get('ref')):
+        print(f"{INFO_STYLE}Package {package_name} is pinned to commit {manifest['ref'][:7]}. "
+              f"Use 'ligma install {package_name}@<ref>' to switch.{RESET_STYLE}")
+        return False
     
     # Check for version mismatch
     local_version = get_package_description(package_name, installed=True)['version']
     
     try:
-        # Get the online version
-        online_content = get_github_file_content(package_name, "description.txt")
-        if online_content:
-            online_desc = parse_description_file(online_content)
+        # Get the online version and compare the package files
+        _, online_desc = find_catalog_package(package_name, max_age=TREE_CACHE_TTL)
+        if online_desc and 'version' in online_desc:
             online_version = online_desc['version']
+            outdated, _ = find_package_updates([package_name])
             
-            if local_version == online_version:
+            if package_name not in outdated:
                 print(f"{INFO_STYLE}Package {package_name} is already at the latest version ({local_version}).{RESET_STYLE}")
                 confirm = input(f"{WARNING_STYLE}Force update anyway? (y/N): {RESET_STYLE}")
                 if confirm.lower() != 'y':
@@ -986,6 +3803,7 @@ def update_package(package_name):
                     return False
             else:
                 print(f"{INFO_STYLE}Updating {package_name} from version {local_version} to {online_version}...{RESET_STYLE}")
+                print_package_changes(outdated[package_name][1])
         else:
             print(f"{WARNING_STYLE}Could not check online version for {package_name}.{RESET_STYLE}")
             confirm = input(f"{WARNING_STYLE}Continue with update? (y/N): {RESET_STYLE}")
@@ -1003,6 +3821,174 @@ def update_package(package_name):
     return download_package(package_name, is_update=True)
 
 # Load and save source configurations
+def load_lock_file():
+    """Load ligma.lock, returns None if there is none or it can't be read"""
+    if not os.path.exists(LOCK_FILE):
+        return None
+    try:
+        with open(LOCK_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        log_error("Error reading ligma.lock", exception=e)
+        return None
+
+def write_lock_file():
+    """Record the exact state of every installed package in ligma.lock
+    
+    Each package is pinned to its source, the commit it was installed from
+    and the blob SHA of every file. Packages installed before commits were
+    recorded are pinned to the commit of the cached tree if their files match it.
+    
+    Returns:
+        bool: True if the lock file was written
+    """
+    packages = {}
+    skipped = []
+    for pkg in get_installed_packages():
+        manifest = load_package_manifest(pkg)
+        if not manifest or not manifest.get('source'):
+            skipped.append(pkg)
+            continue
+        source, ref = manifest['source'], manifest.get('ref', DEFAULT_REF)
+        commit = manifest.get('commit')
+        if not commit:
+            tree = get_source_tree(source, ref)
+            remote_files = get_package_files(tree, pkg) if tree else {}
+            if {rel_path: entry['sha'] for rel_path, entry in remote_files.items()} == manifest['files']:
+                commit = get_source_commit(source, ref)
+        # Local sources have no commits, their files are pinned by blob SHA alone
+        if not commit and not is_local_source(source):
+            skipped.append(pkg)
+            continue
+        packages[pkg] = {
+            'source': source,
+            'ref': ref,
+            'commit': commit,
+            'files': manifest['files']
+        }
+
+    lock = {'version': 1, 'generated_at': time.time(), 'packages': packages}
+    try:
+        with open(f"{LOCK_FILE}.part", 'w', encoding='utf-8') as f:
+            json.dump(lock, f, indent=2, sort_keys=True)
+        os.replace(f"{LOCK_FILE}.part", LOCK_FILE)
+    except Exception as e:
+        print(f"{ERROR_STYLE}Error writing ligma.lock: {e}{RESET_STYLE}")
+        log_error("Error writing ligma.lock", exception=e)
+        return False
+
+    print(f"{SUCCESS_STYLE}Locked {len(packages)} packages in ligma.lock.{RESET_STYLE}")
+    if skipped:
+        print(f"{WARNING_STYLE}Not locked (update them to record their commit): {', '.join(skipped)}{RESET_STYLE}")
+    log_info(f"Wrote ligma.lock with {len(packages)} packages, skipped {skipped}")
+    return True
+
+def sync_locked_package(package_name, locked):
+    """Bring one installed package to the exact state recorded in ligma.lock
+    
+    Files that are installed already or present in the blob store are reused,
+    only missing blobs are downloaded from the locked commit. The package is
+    only activated if every file matches its locked blob SHA.
+    
+    Returns:
+        bool: True if the package matches the lock afterwards
+    """
+    source, commit, locked_files = locked['source'], locked['commit'], locked['files']
+    # Local sources have no commits; files are read from disk and checked against their SHAs
+    label = f"{source}@{commit[:7]}" if commit else source
+    package_dir = os.path.join(PACKAGES_DIR, package_name)
+    manifest = load_package_manifest(package_name) if os.path.exists(package_dir) else None
+    if manifest and manifest.get('files') == locked_files and all(
+            file_matches_blob(os.path.join(package_dir, *rel_path.split('/')), sha)
+            for rel_path, sha in locked_files.items()):
+        print(f"{SUCCESS_STYLE}{package_name} already matches the lock.{RESET_STYLE}")
+        return True
+
+    local_files = manifest['files'] if manifest else {}
+    files = {rel_path: {'path': f"{package_name}/{rel_path}", 'sha': sha} for rel_path, sha in locked_files.items()}
+    changes = diff_package_files(local_files, files)
+    # Unchanged files are refetched too if they were deleted or edited since install
+    missing = [rel_path for rel_path in files
+               if rel_path not in changes['added'] and rel_path not in changes['changed']
+               and not file_matches_blob(os.path.join(package_dir, *rel_path.split('/')), locked_files[rel_path])]
+
+    staging_dir = create_staging_dir(package_name, clone_from=package_dir if manifest else None)
+    try:
+        failed = []
+        download_count, error_count, reused_count = fetch_package_files(
+            source, staging_dir, files, changes['added'] + changes['changed'] + missing,
+            failed=failed, ref=commit or DEFAULT_REF
+        )
+        for rel_path in changes['removed']:
+            file_path = os.path.join(staging_dir, *rel_path.split('/'))
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        remove_empty_dirs(staging_dir)
+
+        # Every file has to be the locked blob, a partial restore is not the locked state
+        mismatched = []
+        for rel_path, sha in locked_files.items():
+            file_path = os.path.join(staging_dir, *rel_path.split('/'))
+            if not file_matches_blob(file_path, sha):
+                mismatched.append(rel_path)
+        if error_count or mismatched:
+            print(f"{ERROR_STYLE}Could not restore {package_name} from {label}: "
+                  f"{error_count + len(mismatched)} files failed.{RESET_STYLE}")
+            log_error(f"Sync of {package_name} failed, errors: {error_count}, mismatched: {mismatched}")
+            return False
+
+        write_package_manifest(package_name, staging_dir, source, locked_files,
+                               ref=locked.get('ref', DEFAULT_REF), commit=commit)
+        if not activate_package_dir(package_name, staging_dir):
+            return False
+        staging_dir = None
+    finally:
+        if staging_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    install_package_requirements(package_name)
+    print(f"{SUCCESS_STYLE}{package_name} synced to {label} "
+          f"({download_count} downloaded, {reused_count} from blob store).{RESET_STYLE}")
+    log_info(f"Synced {package_name} to {label}: {download_count} downloaded, {reused_count} reused")
+    return True
+
+def sync_packages():
+    """Make the installed packages exactly match ligma.lock
+    
+    Packages are restored concurrently; packages that aren't in the lock file
+    are uninstalled.
+    
+    Returns:
+        bool: True if every locked package was restored
+    """
+    lock = load_lock_file()
+    if lock is None:
+        print(f"{ERROR_STYLE}No ligma.lock found. Use 'ligma lock' to create one.{RESET_STYLE}")
+        return False
+
+    locked_packages = lock.get('packages', {})
+    for pkg in get_installed_packages():
+        if pkg not in locked_packages:
+            print(f"{WARNING_STYLE}{pkg} is not in ligma.lock, removing it.{RESET_STYLE}")
+            uninstall_package(pkg)
+
+    os.makedirs(PACKAGES_DIR, exist_ok=True)
+    print(f"\n{INFO_STYLE}Syncing {len(locked_packages)} packages with ligma.lock...{RESET_STYLE}")
+    log_info(f"Syncing packages with ligma.lock: {', '.join(locked_packages)}")
+    results = run_install_jobs({
+        pkg: (lambda pkg=pkg, locked=locked: sync_locked_package(pkg, locked))
+        for pkg, locked in locked_packages.items()
+    })
+
+    failed = [pkg for pkg, success in results.items() if not success]
+    if failed:
+        print(f"\n{ERROR_STYLE}Failed to sync: {', '.join(failed)}{RESET_STYLE}")
+        log_warning(f"Sync incomplete. Failed packages: {', '.join(failed)}")
+        return False
+    print(f"\n{SUCCESS_STYLE}All {len(locked_packages)} packages match ligma.lock.{RESET_STYLE}")
+    log_success(f"Synced {len(locked_packages)} packages with ligma.lock")
+    return True
+
 def load_sources():
     """Load package sources from ligma.sigs file"""
     if not os.path.exists(SOURCES_FILE):
@@ -1032,18 +4018,24 @@ def save_sources(sources):
 def add_source(source):
     """Add a new package source"""
     try:
-        # Validate source format
-        if not '/' in source:
-            print(f"{ERROR_STYLE}Invalid source format. Use 'username/repo' format.{RESET_STYLE}")
-            return False
-            
-        # Verify the source repository exists
-        username, repo = source.split('/')
-        url = f"https://api.github.com/repos/{username}/{repo}"
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"{ERROR_STYLE}Repository not found or inaccessible: {source}{RESET_STYLE}")
-            return False
+        if is_local_source(source):
+            # Local sources only have to be an existing directory
+            if not os.path.isdir(get_local_source_path(source)):
+                print(f"{ERROR_STYLE}Directory not found: {get_local_source_path(source)}{RESET_STYLE}")
+                return False
+            source = normalize_source(source)
+        else:
+            # Validate source format
+            repository = get_source_endpoints(source)[3]
+            if repository.count('/') != 1:
+                print(f"{ERROR_STYLE}Invalid source format. Use 'username/repo' format, a mirror URL or a local directory.{RESET_STYLE}")
+                return False
+                
+            # Verify the source repository exists
+            response = github_api_get(get_api_url(source, ""))
+            if response.status_code != 200:
+                print(f"{ERROR_STYLE}Repository not found or inaccessible: {source}{RESET_STYLE}")
+                return False
 
         sources = load_sources()
         if source in sources:
@@ -1066,6 +4058,8 @@ def remove_source(source):
         return False
         
     sources = load_sources()
+    if source not in sources and is_local_source(source):
+        source = normalize_source(source)
     if source not in sources:
         print(f"{WARNING_STYLE}Source not found: {source}{RESET_STYLE}")
         return False
@@ -1078,13 +4072,7 @@ def remove_source(source):
 
 def list_sources():
     """List all configured package sources"""
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import header_sth, description_sth, SUCCESS_STYLE, INFO_STYLE, WARNING_STYLE
-    except ImportError:
-        # Fallback styles
-        header_sth = INFO_STYLE
-        description_sth = RESET_STYLE
+    header_sth, description_sth = get_styles('header_sth', 'description_sth')
     
     sources = load_sources()
     print(f"\n{header_sth}Package Sources:{RESET_STYLE}")
@@ -1102,12 +4090,7 @@ def list_sources():
 
 def show_verified_sources():
     """Show list of verified external sources"""
-    try:
-        # Try to get styles from SigmaOS if available
-        from SigmaOS import header_sth, SUCCESS_STYLE, WARNING_STYLE, INFO_STYLE
-    except ImportError:
-        # Fallback styles
-        header_sth = INFO_STYLE
+    header_sth = get_style('header_sth')
     
     print(f"\n{header_sth}Verified Package Sources:{RESET_STYLE}")
     if VERIFIED_SOURCES:
@@ -1115,4 +4098,234 @@ def show_verified_sources():
             print(f"{SUCCESS_STYLE}  ▶ {source}{RESET_STYLE}")
     else:
         print(f"{WARNING_STYLE}No verified sources available yet.{RESET_STYLE}")
-    print(f"\n{INFO_STYLE}Note: Verified sources are curated and trusted package repositories.{RESET_STYLE}")
\ No newline at end of file
+    print(f"\n{INFO_STYLE}Note: Verified sources are curated and trusted package repositories.{RESET_STYLE}")
+# Local package mirror
+def build_mirror(target_dir=None):
+    """Snapshot the configured sources into a mirror directory
+    
+    Each source gets <target_dir>/<user>/<repo>/ holding its tree listing
+    (tree.json), every file by blob SHA (blobs/) and a zip archive of the
+    repository (archive.zip). Blobs already in the local blob store are
+    linked instead of downloaded, and rebuilding only fetches what changed.
+    
+    Args:
+        target_dir (str, optional): Mirror directory. Defaults to MIRROR_DIR.
+    
+    Returns:
+        bool: True if every source was mirrored
+    """
+    target_dir = os.path.abspath(target_dir or MIRROR_DIR)
+    index = {'built_at': time.time(), 'sources': {}}
+    success = True
+
+    for source in get_ordered_sources():
+        if is_local_source(source):
+            print(f"{WARNING_STYLE}Skipping local source {source}, share its directory instead.{RESET_STYLE}")
+            continue
+        print(f"\n{INFO_STYLE}Mirroring {source}...{RESET_STYLE}")
+        catalog = get_catalog(source, force=True)
+        if catalog is None:
+            print(f"{ERROR_STYLE}Could not list {source}.{RESET_STYLE}")
+            success = False
+            continue
+
+        repository = get_source_endpoints(source)[3]
+        repo_dir = os.path.join(target_dir, *repository.split('/'))
+        blobs_dir = os.path.join(repo_dir, "blobs")
+        os.makedirs(blobs_dir, exist_ok=True)
+        commit = catalog.get('commit')
+        blobs = {entry['sha']: entry for entry in catalog['tree'] if entry['type'] == 'blob'}
+
+        jobs = []
+        reused_count = 0
+        for sha, entry in blobs.items():
+            blob_path = os.path.join(blobs_dir, sha)
+            if os.path.exists(blob_path):
+                continue
+            if verify_stored_blob(sha):
+                link_or_copy(get_blob_path(sha), blob_path)
+                reused_count += 1
+                continue
+            jobs.append((get_raw_file_url(source, entry['path'], commit or DEFAULT_REF), blob_path))
+        download_count, error_count = download_files(jobs)
+        for _, blob_path in jobs:
+            sha = os.path.basename(blob_path)
+            if os.path.exists(blob_path) and not store_blob(blob_path, sha):
+                os.remove(blob_path)
+                error_count += 1
+
+        # The snapshot only holds the current tree
+        for name in os.listdir(blobs_dir):
+            if name not in blobs:
+                os.remove(os.path.join(blobs_dir, name))
+
+        tree_path = os.path.join(repo_dir, "tree.json")
+        with open(f"{tree_path}.part", 'w', encoding='utf-8') as f:
+            json.dump({'sha': commit, 'tree': catalog['tree'], 'truncated': False}, f)
+        os.replace(f"{tree_path}.part", tree_path)
+
+        # Same layout as GitHub's archives, so archive installs work against the mirror
+        archive_path = os.path.join(repo_dir, "archive.zip")
+        prefix = f"{repository.split('/')[1]}-{DEFAULT_REF}"
+        with ZipFile(f"{archive_path}.part", 'w', ZIP_DEFLATED) as archive:
+            for entry in catalog['tree']:
+                blob_path = os.path.join(blobs_dir, entry.get('sha') or "")
+                if entry['type'] == 'blob' and os.path.isfile(blob_path):
+                    archive.write(blob_path, f"{prefix}/{entry['path']}")
+        os.replace(f"{archive_path}.part", archive_path)
+
+        index['sources'][repository] = {'source': source, 'commit': commit, 'packages': sorted(catalog['packages'])}
+        print(f"{SUCCESS_STYLE}  ▶ {len(catalog['packages'])} packages, {len(blobs)} files "
+              f"({download_count} downloaded, {reused_count} from blob store, {error_count} errors){RESET_STYLE}")
+        log_info(f"Mirrored {source} at {commit}: {download_count} downloaded, {reused_count} reused, {error_count} errors")
+        success = success and error_count == 0
+
+    with open(os.path.join(target_dir, "index.json"), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    print(f"\n{SUCCESS_STYLE}Mirror written to {target_dir}. Serve it with 'ligma mirror serve'.{RESET_STYLE}")
+    return success
+
+class _MirrorRequestHandler(BaseHTTPRequestHandler):
+    """Answers the GitHub API, raw file and archive requests ligma makes, from a mirror directory"""
+
+    mirror_dir = MIRROR_DIR
+    # Parsed tree.json files keyed by repository, reloaded when the mirror is rebuilt
+    repositories = {}
+
+    def load_repository(self, user, repo):
+        repo_dir = os.path.join(self.mirror_dir, user, repo)
+        tree_path = os.path.join(repo_dir, "tree.json")
+        if not os.path.isfile(tree_path):
+            return None
+        mtime = os.path.getmtime(tree_path)
+        cached = self.repositories.get((user, repo))
+        if cached is None or cached['mtime'] != mtime:
+            with open(tree_path, 'rb') as f:
+                body = f.read()
+            data = json.loads(body)
+            cached = {
+                'mtime': mtime,
+                'dir': repo_dir,
+                'body': body,
+                'commit': data.get('sha'),
+                'etag': '"' + hashlib.sha1(body).hexdigest() + '"',
+                'files': {entry['path']: entry['sha'] for entry in data['tree'] if entry['type'] == 'blob'}
+            }
+            self.repositories[(user, repo)] = cached
+        return cached
+
+    def send_body(self, body, content_type="application/json", headers=None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, path, content_type="application/octet-stream"):
+        if not os.path.isfile(path):
+            return self.send_error(404)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_GET(self):
+        parts = [unquote(part) for part in urlparse(self.path).path.split('/') if part]
+        if parts[:2] == ["api", "repos"] and len(parts) >= 4:
+            kind, (user, repo), rest = "api", parts[2:4], parts[4:]
+        elif parts[:1] == ["raw"] and len(parts) >= 5:
+            kind, (user, repo), rest = "raw", parts[1:3], parts[3:]
+        elif parts[:1] == ["codeload"] and len(parts) == 5 and parts[3] == "zip":
+            kind, (user, repo), rest = "codeload", parts[1:3], parts[4:]
+        else:
+            return self.send_error(404)
+        if not all(MIRROR_NAME_PATTERN.fullmatch(name) and name.strip('.') for name in (user, repo)):
+            return self.send_error(404)
+
+        repository = self.load_repository(user, repo)
+        if repository is None:
+            return self.send_error(404)
+        # The mirror holds one snapshot, reachable by branch name or by its commit
+        refs = {DEFAULT_REF, repository['commit']}
+
+        if kind == "api" and not rest:
+            return self.send_body(json.dumps({'full_name': f"{user}/{repo}"}).encode())
+        if kind == "api" and rest[:2] == ["git", "trees"] and len(rest) == 3 and rest[2] in refs:
+            if self.headers.get("If-None-Match") == repository['etag']:
+                self.send_response(304)
+                self.send_header("ETag", repository['etag'])
+                return self.end_headers()
+            return self.send_body(repository['body'], headers={"ETag": repository['etag']})
+        if kind == "api" and rest[:1] == ["commits"] and len(rest) == 2 and rest[1] in refs and repository['commit']:
+            if "sha" in self.headers.get("Accept", ""):
+                return self.send_body(repository['commit'].encode(), "text/plain")
+            return self.send_body(json.dumps({'sha': repository['commit']}).encode())
+        if kind == "raw" and rest[0] in refs:
+            sha = repository['files'].get("/".join(rest[1:]))
+            if sha:
+                return self.send_file(os.path.join(repository['dir'], "blobs", sha), "text/plain")
+        if kind == "codeload" and rest[0] in refs:
+            return self.send_file(os.path.join(repository['dir'], "archive.zip"), "application/zip")
+        return self.send_error(404)
+
+    def log_message(self, format, *args):
+        log_debug(f"mirror {self.address_string()}: {format % args}")
+
+def create_mirror_server(mirror_dir=None, port=None):
+    """Create an HTTP server for a mirror directory without starting it"""
+    handler = type("MirrorRequestHandler", (_MirrorRequestHandler,), {
+        'mirror_dir': os.path.abspath(mirror_dir or MIRROR_DIR),
+        'repositories': {}
+    })
+    return ThreadingHTTPServer(("", MIRROR_PORT if port is None else port), handler)
+
+def serve_mirror(mirror_dir=None, port=None):
+    """Serve a mirror built by build_mirror until interrupted
+    
+    Other machines can add http://<host>:<port>/<user>/<repo> as a source, or
+    send all their GitHub requests to it with 'ligma mirror use'.
+    """
+    mirror_dir = os.path.abspath(mirror_dir or MIRROR_DIR)
+    index_path = os.path.join(mirror_dir, "index.json")
+    if not os.path.exists(index_path):
+        print(f"{ERROR_STYLE}No mirror found in {mirror_dir}. Use 'ligma mirror build' first.{RESET_STYLE}")
+        return False
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+
+    try:
+        server = create_mirror_server(mirror_dir, port)
+    except OSError as e:
+        print(f"{ERROR_STYLE}Could not start the mirror server: {e}{RESET_STYLE}")
+        log_error("Could not start the mirror server", exception=e)
+        return False
+
+    address = f"http://{platform.node() or 'localhost'}:{server.server_address[1]}"
+    print(f"\n{SUCCESS_STYLE}Serving mirror of {len(index['sources'])} sources at {address}{RESET_STYLE}")
+    for repository in index['sources']:
+        print(f"  ▶ {address}/{repository}")
+    print(f"{INFO_STYLE}Other machines: 'ligma mirror use {address}' or add a source above. Press Ctrl+C to stop.{RESET_STYLE}")
+    log_info(f"Serving mirror {mirror_dir} at {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{INFO_STYLE}Mirror server stopped.{RESET_STYLE}")
+    finally:
+        server.server_close()
+    return True
+
+def use_mirror(url):
+    """Send all GitHub requests to a mirror, or back to GitHub if url is None"""
+    settings = load_user_settings().copy()
+    if url:
+        settings['ligma_mirror'] = url.rstrip('/')
+        print(f"{SUCCESS_STYLE}Packages are now fetched from {settings['ligma_mirror']}.{RESET_STYLE}")
+    else:
+        settings.pop('ligma_mirror', None)
+        print(f"{SUCCESS_STYLE}Packages are now fetched from GitHub.{RESET_STYLE}")
+    save_user_settings(settings)
+    log_info(f"Mirror set to {url}")